@@ -0,0 +1,56 @@
+"""key daily counts
+
+Revision ID: 0c7035039bb0
+Revises: da1b89a0cf95
+Create Date: 2026-10-18 21:02:47.518960
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0c7035039bb0'
+down_revision: Union[str, None] = 'da1b89a0cf95'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # two refreshes of the same day (e.g. running concurrently) could each add its rows, so recount from scratch in
+    # case that already happened...
+    op.execute("DELETE FROM incident.daily_counts")
+    op.execute("""
+        INSERT INTO incident.daily_counts (user_id, date, category, custom_label, severity, n_incidents)
+        SELECT i.user_id
+        , i.incident_at::date as date
+        , c.category
+        , i.custom_label
+        , i.severity
+        , count(*) as n_incidents
+        FROM incident.incident i
+        LEFT JOIN LATERAL (
+            SELECT string_agg(distinct category, ', ') as category
+            FROM incident.incident_category ic
+            WHERE ic.incident_id = i.incident_id
+        ) c on TRUE
+        WHERE i.incident_at is not null
+        GROUP BY 1,2,3,4,5
+    """)
+
+    # ...and from now on, allow only one row per key.  the labels and category are often null, and a null has to
+    # count as a value of its own here.  this also covers the (user_id, date) lookups, so that index can go
+    op.execute("""
+        ALTER TABLE incident.daily_counts
+            ADD CONSTRAINT daily_counts_key UNIQUE NULLS NOT DISTINCT (user_id, date, category, custom_label, severity)
+    """)
+    op.execute("DROP INDEX incident.daily_counts_user_id_date_idx")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("CREATE INDEX on incident.daily_counts (user_id, date)")
+    op.execute("ALTER TABLE incident.daily_counts DROP CONSTRAINT daily_counts_key")
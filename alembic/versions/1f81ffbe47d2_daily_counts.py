@@ -0,0 +1,59 @@
+"""daily counts
+
+Revision ID: 1f81ffbe47d2
+Revises: 64df2120874a
+Create Date: 2026-10-18 11:02:17.304826
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1f81ffbe47d2'
+down_revision: Union[str, None] = '64df2120874a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # rollup for the heatmap/timeline pages, kept up to date by data_processing.daily_counts
+    op.execute("""
+        CREATE TABLE incident.daily_counts
+        (
+            user_id             integer                  not null,
+            date                date                     not null,
+            category            character varying,
+            custom_label        character varying,
+            severity            character varying,
+            n_incidents         integer                  not null
+        )
+    """)
+
+    op.execute("CREATE INDEX on incident.daily_counts (user_id, date)")
+
+    op.execute("""
+        INSERT INTO incident.daily_counts (user_id, date, category, custom_label, severity, n_incidents)
+        SELECT i.user_id
+        , i.incident_at::date as date
+        , c.category
+        , i.custom_label
+        , i.severity
+        , count(*) as n_incidents
+        FROM incident.incident i
+        LEFT JOIN LATERAL (
+            SELECT string_agg(distinct category, ', ') as category
+            FROM incident.incident_category ic
+            WHERE ic.incident_id = i.incident_id
+        ) c on TRUE
+        WHERE i.incident_at is not null
+        GROUP BY 1,2,3,4,5
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("""DROP TABLE incident.daily_counts;""")
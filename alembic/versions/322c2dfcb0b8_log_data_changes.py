@@ -0,0 +1,84 @@
+"""log data changes
+
+Revision ID: 322c2dfcb0b8
+Revises: bbe589250d6d
+Create Date: 2026-10-18 20:48:31.902114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '322c2dfcb0b8'
+down_revision: Union[str, None] = 'bbe589250d6d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# everything the dashboard shows is read from these
+LOGGED_TABLES = ['incident', 'incident_category', 'category', 'daily_counts']
+
+# (event, which transition table holds the rows it changed)
+LOGGED_EVENTS = [('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # the dashboard cache's data version.  a row is added for every statement that changes the tables above, so the
+    # sum of n_statements goes up whenever any such transaction commits, no matter how long it ran.  (max(change_id)
+    # doesn't: ids are handed out as statements run, not as they commit, and the same goes for thrive_modified_dtm,
+    # which is the transaction's start time.)  after each ingestion, old rows are folded into a single row with their
+    # total (see `prune_data_changes`), which keeps the log small without changing the sum
+    op.execute("""
+        CREATE TABLE incident.data_change
+        (
+            change_id           bigserial                primary key,
+            table_name          character varying        not null,
+            operation           character varying        not null,
+            changed_at          timestamp with time zone not null default clock_timestamp(),
+            n_statements        bigint                   not null default 1
+        )
+    """)
+
+    # the cache no longer reads thrive_modified_dtm, so these only slow down writes
+    op.execute("DROP INDEX incident.incident_thrive_modified_dtm_idx")
+    op.execute("DROP INDEX incident.incident_category_thrive_modified_dtm_idx")
+
+    # statements that changed no rows (e.g. a re-ingest where every incident was unchanged) aren't logged
+    op.execute("""
+        CREATE FUNCTION incident.log_data_change()
+            RETURNS TRIGGER AS $$
+            BEGIN
+                IF EXISTS (SELECT 1 FROM changed_rows) THEN
+                    INSERT INTO incident.data_change (table_name, operation) VALUES (TG_TABLE_NAME, TG_OP);
+                END IF;
+                RETURN NULL;
+            END;
+            $$ language 'plpgsql';
+    """)
+
+    # a trigger with a transition table can only be for one event, so there is one per table and event
+    for table in LOGGED_TABLES:
+        for event, transition in LOGGED_EVENTS:
+            op.execute(f"""
+                CREATE TRIGGER {table}_{event.lower()}_data_change
+                AFTER {event} ON incident.{table}
+                REFERENCING {transition} TABLE AS changed_rows
+                FOR EACH STATEMENT
+                EXECUTE PROCEDURE incident.log_data_change();
+            """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in LOGGED_TABLES:
+        for event, _ in LOGGED_EVENTS:
+            op.execute(f"DROP TRIGGER {table}_{event.lower()}_data_change ON incident.{table}")
+
+    op.execute("DROP FUNCTION incident.log_data_change()")
+    op.execute("DROP TABLE incident.data_change")
+
+    op.execute("CREATE INDEX on incident.incident (thrive_modified_dtm)")
+    op.execute("CREATE INDEX on incident.incident_category (thrive_modified_dtm)")
@@ -0,0 +1,46 @@
+"""track category modifications
+
+Revision ID: 64df2120874a
+Revises: c2ec24b0b990
+Create Date: 2026-10-18 10:12:40.518233
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '64df2120874a'
+down_revision: Union[str, None] = 'c2ec24b0b990'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # the dashboard cache checked max(thrive_modified_dtm) on every page run, so make that an index lookup (since
+    # 322c2dfcb0b8 it reads incident.data_change instead, and these are dropped there)
+    op.execute("CREATE INDEX on incident.incident (thrive_modified_dtm)")
+    op.execute("CREATE INDEX on incident.incident_category (thrive_modified_dtm)")
+
+    # ...and make sure updates to categories move it, like they already do for incidents
+    op.execute(
+        """CREATE TRIGGER incident_category_modtime
+           BEFORE UPDATE ON incident.incident_category FOR EACH ROW
+           EXECUTE PROCEDURE update_thrive_last_modified_column();"""
+    )
+    op.execute(
+        """CREATE TRIGGER category_modtime
+           BEFORE UPDATE ON incident.category FOR EACH ROW
+           EXECUTE PROCEDURE update_thrive_last_modified_column();"""
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER category_modtime ON incident.category")
+    op.execute("DROP TRIGGER incident_category_modtime ON incident.incident_category")
+    op.execute("DROP INDEX incident.incident_thrive_modified_dtm_idx")
+    op.execute("DROP INDEX incident.incident_category_thrive_modified_dtm_idx")
@@ -0,0 +1,29 @@
+"""index incident paging
+
+Revision ID: 6d3556e0632b
+Revises: 8314cff7f863
+Create Date: 2026-10-18 13:20:41.870215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6d3556e0632b'
+down_revision: Union[str, None] = '8314cff7f863'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # the Data page pages through incidents on (incident_at, incident_id), in either direction
+    op.execute("CREATE INDEX on incident.incident (user_id, incident_at, incident_id)")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP INDEX incident.incident_user_id_incident_at_incident_id_idx")
@@ -0,0 +1,29 @@
+"""index subcategory membership
+
+Revision ID: 8314cff7f863
+Revises: 1f81ffbe47d2
+Create Date: 2026-10-18 11:48:55.162093
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8314cff7f863'
+down_revision: Union[str, None] = '1f81ffbe47d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # subcategory -> incidents, for filtering incidents by subcategory; the unique index covers the other direction
+    op.execute("CREATE INDEX on incident.incident_category (subcategory, incident_id)")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP INDEX incident.incident_category_subcategory_incident_id_idx")
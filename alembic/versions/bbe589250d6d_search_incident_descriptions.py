@@ -0,0 +1,38 @@
+"""search incident descriptions
+
+Revision ID: bbe589250d6d
+Revises: 6d3556e0632b
+Create Date: 2026-10-18 13:52:09.411387
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'bbe589250d6d'
+down_revision: Union[str, None] = '6d3556e0632b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # kept in step with the description by postgres itself, so nothing that writes incidents needs to know about it
+    op.execute("""
+        ALTER TABLE incident.incident
+            ADD COLUMN description_tsv tsvector
+            GENERATED ALWAYS AS (to_tsvector('english', coalesce(description, ''))) STORED;
+    """)
+
+    op.execute("CREATE INDEX on incident.incident USING GIN (description_tsv)")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("""
+        ALTER TABLE incident.incident
+            DROP COLUMN description_tsv;
+    """)
@@ -0,0 +1,35 @@
+"""index incident labels
+
+Revision ID: da1b89a0cf95
+Revises: 322c2dfcb0b8
+Create Date: 2026-10-18 20:55:14.207635
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'da1b89a0cf95'
+down_revision: Union[str, None] = '322c2dfcb0b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # the dashboard filters on severity and custom label case insensitively, as `lower(col) = lower(:value)`, usually
+    # along with a date range.  labels are set by hand outside of ingestion, so their case can't be normalized on the
+    # way in; index the expression the filters use instead
+    op.execute("CREATE INDEX incident_user_id_lower_severity_idx "
+               "on incident.incident (user_id, lower(severity), incident_at)")
+    op.execute("CREATE INDEX incident_user_id_lower_custom_label_idx "
+               "on incident.incident (user_id, lower(custom_label), incident_at)")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP INDEX incident.incident_user_id_lower_severity_idx")
+    op.execute("DROP INDEX incident.incident_user_id_lower_custom_label_idx")
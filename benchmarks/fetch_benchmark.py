@@ -0,0 +1,54 @@
+import argparse
+import logging
+import time
+
+from db_utils import FETCH_METHODS, fetch_dataframe, get_engine
+
+logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
+
+"""
+Compares rows per second for each way of fetching a query result into a data frame (COPY + pyarrow vs read_sql).
+The rows are generated by postgres itself, shaped like the dashboard's incident rows, so this only needs a database
+at LOCAL_DB_URL, not any data in it.
+
+    python -m benchmarks.fetch_benchmark --n-rows 1000000
+"""
+
+# one row per generated incident: an id, a date, a couple of labels, and a sentence or so of text
+benchmark_query = """
+    SELECT md5(g::text)::uuid as incident_id
+    , date '2015-01-01' + (g % 3650)::int as date
+    , (ARRAY['HIGH', 'MEDIUM', 'LOW'])[1 + g % 3] as severity
+    , (ARRAY['school', 'weekend', 'holiday', NULL])[1 + g % 4] as custom_label
+    , repeat(md5((g * 7)::text), 3) as description
+    , g % 5 = 0 as is_flagged
+    FROM generate_series(1, :n_rows) g
+"""
+
+
+def time_fetch(n_rows: int, method: str) -> float:
+    start = time.perf_counter()
+    df = fetch_dataframe(get_engine(), benchmark_query, {'n_rows': n_rows}, method=method)
+    seconds = time.perf_counter() - start
+    if len(df) != n_rows:
+        raise ValueError(f"Fetched {len(df)} rows with {method}, expected {n_rows}")
+
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--n-rows', type=int, default=1_000_000, help='Number of rows to fetch')
+    parser.add_argument('--methods', nargs='+', choices=FETCH_METHODS, default=FETCH_METHODS,
+                        help='Fetch methods to compare')
+    parser.add_argument('--repeat', type=int, default=3, help='Times to fetch with each method (the best is kept)')
+    args = parser.parse_args()
+
+    for method in args.methods:
+        logging.info(f"Fetching {args.n_rows} rows with {method}...")
+        seconds = min(time_fetch(args.n_rows, method) for _ in range(args.repeat))
+        print(f"{method:8s} {seconds:8.3f}s  ({args.n_rows / seconds:,.0f} rows/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+import argparse
+import calendar
+import logging
+
+import numpy as np
+import pandas as pd
+
+logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
+
+"""
+Writes a synthetic incident file in the same semi-structured markdown format `read_mkdown_file` parses:
+
+- "#" period headers spanning a few months, e.g. "# Nov 2022-Feb 2023" (so some periods cross New Year)
+- incidents with a full date in brackets ("- [Jan 28] ..."), a month in brackets ("- [jan] ..."), a month followed by
+  a period ("- August. ..."), a date followed by a period ("- Oct 22. ..."), or no date at all
+
+Every date falls inside its period and every description is unique, so the whole file can be ingested with
+--infer-dates.
+
+    python -m benchmarks.incident_corpus --n-lines 1000000 --filename data/corpus_1m.txt
+"""
+
+descriptions = [
+    'Missed the pickup at school and did not answer the phone',
+    'Dropped off two hours late without any notice',
+    'Did not pass on the note from the pediatrician',
+    'Refused to swap weekends even though it was agreed in writing',
+    'Raised voice and swore in front of the kids at the exchange',
+    'Sent the kids without their winter coats or boots',
+    'Skipped the follow up appointment with the dentist',
+    'Told the kids the other parent did not want to see them',
+    'Called the police to do a welfare check for no reason',
+    'Took the kids to a party with a lot of drinking going on',
+]
+
+date_formats = ['full_bracket', 'month_bracket', 'month_period', 'full_period', 'undated']
+date_format_probabilities = [0.35, 0.1, 0.1, 0.15, 0.3]
+
+# periods are this many months long
+period_months = [1, 2, 3, 4, 6]
+
+
+def iter_periods(start: pd.Timestamp, rng: np.random.Generator):
+    # consecutive, non-overlapping periods starting from `start`, forever
+    while True:
+        end = start + pd.DateOffset(months=int(rng.choice(period_months)) - 1)
+        yield start, end
+        start = end + pd.DateOffset(months=1)
+
+
+def format_incident(incident_id: int, date_format: str, date: pd.Timestamp, description: str) -> str:
+    month_abbr = calendar.month_abbr[date.month]
+    month_name = calendar.month_name[date.month]
+    description = f"{description} (ref {incident_id})"
+    if date_format == 'full_bracket':
+        return f"- [{month_abbr} {date.day}] {description}."
+    elif date_format == 'month_bracket':
+        return f"- [{month_abbr.lower()}] {description}."
+    elif date_format == 'month_period':
+        return f"- {month_name}. {description}"
+    elif date_format == 'full_period':
+        return f"- {month_abbr} {date.day}. {description}"
+
+    return f"- {description}."
+
+
+def generate_corpus(filename: str, n_lines: int, lines_per_period: int = 500, start_date: str = '2010-01-01',
+                    seed: int = 47) -> None:
+    """
+    Writes `n_lines` lines (period headers included) to `filename`, a period at a time so memory stays flat
+    """
+    rng = np.random.default_rng(seed)
+    periods = iter_periods(pd.Timestamp(start_date), rng)
+
+    n_written = 0
+    with open(filename, 'w') as file:
+        while n_written < n_lines:
+            period_start, period_end = next(periods)
+            n_incidents = min(int(rng.integers(1, 2 * lines_per_period)), n_lines - n_written - 1)
+            file.write(f"# {period_start:%b %Y}-{period_end:%b %Y}\n")
+
+            # random days within the period, and only then the format, so every date is a real date in the period
+            n_days = (period_end + pd.offsets.MonthEnd(0) - period_start).days + 1
+            dates = period_start + pd.to_timedelta(np.sort(rng.integers(0, n_days, n_incidents)), unit='D')
+            formats = rng.choice(date_formats, n_incidents, p=date_format_probabilities)
+            description_idx = rng.integers(0, len(descriptions), n_incidents)
+
+            file.writelines(format_incident(n_written + i, f, d, descriptions[k]) + '\n'
+                            for i, (f, d, k) in enumerate(zip(formats, dates, description_idx)))
+            n_written += n_incidents + 1
+
+    logging.info(f"Wrote {n_written} lines to {filename}")
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--filename', type=str, required=True, help='File to write the corpus to')
+    parser.add_argument('--n-lines', type=int, default=10_000, help='Number of lines to write')
+    parser.add_argument('--lines-per-period', type=int, default=500, help='Average incidents per period')
+    parser.add_argument('--seed', type=int, default=47)
+    args = parser.parse_args()
+
+    generate_corpus(args.filename, args.n_lines, args.lines_per_period, seed=args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+import argparse
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.parse_benchmark import generate_incident_lines
+from data_processing.utilities import parse_incidents, create_tmp_incident_table
+from db_utils import LOAD_METHODS, bulk_load, get_engine
+
+logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
+
+"""
+Compares rows per second for each way of loading the `tmp_incident` temp table (COPY vs to_sql).  Needs a database
+at LOCAL_DB_URL; nothing is committed, since each load runs in a transaction that is rolled back.
+
+    python -m benchmarks.load_benchmark --n-rows 500000
+"""
+
+
+def generate_upload_df(n_rows: int, seed: int = 47) -> pd.DataFrame:
+    incident_df = parse_incidents(generate_incident_lines(n_rows, seed).to_frame())
+    rng = np.random.default_rng(seed)
+    incident_df['incident_at'] = pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, 5 * 365, n_rows),
+                                                                               unit='D')
+    incident_df['user_id'] = 1
+    return incident_df[['user_id', 'incident_at', 'description', 'description_hash']]
+
+
+def time_load(upload_df: pd.DataFrame, method: str) -> float:
+    with get_engine().connect() as conn:
+        txn = conn.begin()
+        try:
+            create_tmp_incident_table(conn)
+            start = time.perf_counter()
+            bulk_load(conn, upload_df, "tmp_incident", method=method)
+            return time.perf_counter() - start
+        finally:
+            txn.rollback()
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--n-rows', type=int, default=200_000, help='Number of rows to load')
+    parser.add_argument('--methods', nargs='+', choices=LOAD_METHODS, default=LOAD_METHODS,
+                        help='Load methods to compare')
+    args = parser.parse_args()
+
+    upload_df = generate_upload_df(args.n_rows)
+
+    for method in args.methods:
+        logging.info(f"Loading {args.n_rows} rows with {method}...")
+        seconds = time_load(upload_df, method)
+        print(f"{method:8s} {seconds:8.3f}s  ({args.n_rows / seconds:,.0f} rows/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import argparse
+import hashlib
+import logging
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_processing.utilities import parse_incidents
+
+logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
+
+"""
+Benchmarks the columnar incident parsing stage (`parse_incidents`) against the original row-by-row `.apply`
+version, on synthetic lines that cover every date format the parser knows about.  Both versions must produce
+identical output; the benchmark fails loudly if they don't.
+
+    python -m benchmarks.parse_benchmark --n-lines 1000000
+"""
+
+line_templates = [
+    "[{month} {day}] Missed pickup by {n} minutes.",
+    "[{month}] Did not share the school calendar.",
+    "{month} {day}. Cancelled the weekend visit, no reason given.",
+    "{month}. Late to drop-off again",
+    "No date on this one, argued in front of child ({n}).",
+    "\t[{month} {day}].  Forgot the medication, again [].",
+]
+
+months = ['Jan', 'jan', 'January', 'feb', 'March', 'Apr', 'may', 'June', 'Jul', 'august', 'Sep', 'Oct', 'nov',
+          'December']
+
+
+def generate_incident_lines(n_lines: int, seed: int = 47) -> pd.Series:
+    rng = np.random.default_rng(seed)
+    templates = rng.integers(0, len(line_templates), n_lines)
+    month_idx = rng.integers(0, len(months), n_lines)
+    days = rng.integers(1, 29, n_lines)
+    return pd.Series([line_templates[t].format(month=months[m], day=d, n=i)
+                      for i, (t, m, d) in enumerate(zip(templates, month_idx, days))], name='full_incident')
+
+
+def extract_possible_incident_date(s: str) -> str:
+    # the original scalar date extraction, run on one incident at a time
+    for pattern, group in [(r"^\s*\[(.*?)\]", 1), (r"^\s*(\w+(\s+\w+)?)\.", 0)]:
+        match = re.search(pattern, s)
+        if match:
+            return match.group(group).strip('.').strip(' ')
+
+    return None
+
+
+def parse_incidents_row_wise(incident_df: pd.DataFrame) -> pd.DataFrame:
+    # the original implementation in transform_data_for_upload, kept here as the baseline
+    incident_df['parsed_date'] = incident_df.full_incident.apply(extract_possible_incident_date)
+    incident_df['description'] = incident_df \
+        .apply(lambda x: x.full_incident.replace(x.parsed_date or '', '').replace('[]', '').strip(' ').strip('.'),
+               axis=1)
+    incident_df['description_hash'] = incident_df['description'] \
+        .apply(lambda x: hashlib.sha256(x.encode('utf-8')).hexdigest())
+    return incident_df
+
+
+def time_it(f, incident_df: pd.DataFrame) -> (float, pd.DataFrame):
+    start = time.perf_counter()
+    result = f(incident_df.copy())
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--n-lines', type=int, default=200_000, help='Number of synthetic incident lines')
+    args = parser.parse_args()
+
+    incident_df = generate_incident_lines(args.n_lines).to_frame()
+
+    logging.info(f"Parsing {args.n_lines} lines row by row...")
+    row_wise_seconds, expected = time_it(parse_incidents_row_wise, incident_df)
+
+    logging.info(f"Parsing {args.n_lines} lines column-wise...")
+    columnar_seconds, actual = time_it(parse_incidents, incident_df)
+
+    pd.testing.assert_frame_equal(expected, actual)
+
+    print(f"row-wise:    {row_wise_seconds:8.3f}s  ({args.n_lines / row_wise_seconds:,.0f} lines/s)")
+    print(f"column-wise: {columnar_seconds:8.3f}s  ({args.n_lines / columnar_seconds:,.0f} lines/s)")
+    print(f"speedup:     {row_wise_seconds / columnar_seconds:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+import argparse
+import functools
+import json
+import logging
+import os
+import subprocess
+import tempfile
+import time
+
+logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
+
+"""
+End-to-end benchmark suite: generates synthetic incident files of several sizes, ingests each one into a throwaway
+postgres (timing every ingestion stage, for a first load and for an unchanged re-load), then times every dashboard
+query against the result.  Results go into a JSON file per run, named after the commit, so runs can be compared
+with --compare.
+
+The database at --db-url is migrated to head and its incident tables are emptied before each size, so never point
+this at a database you care about.
+
+    python -m benchmarks.run_suite --db-url postgresql://localhost/thrive_bench --sizes 10000 100000 1000000
+    python -m benchmarks.run_suite --compare benchmarks/results/<old>.json benchmarks/results/<new>.json
+"""
+
+# subcategories to randomly assign to the generated incidents, so the dashboard queries have something to join on
+bench_categories = {
+    'Logistics': ['Missed/late pickups/drop-offs', 'Interference w/ parenting time'],
+    'Communication': ['Failure to communicate child-related info', 'Attempt at alienation'],
+    'Care': ['Failure to provide necessities', 'Medical neglect', 'Exposing child to inappropriate env'],
+    'Conduct': ['Emotional outbursts in front of child', 'Police/CPS involvement'],
+}
+
+
+def get_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def reset_database() -> None:
+    from sqlalchemy import text
+    from db_utils import get_engine
+
+    # migrate the same way as any other database, with the alembic cli and alembic.ini
+    subprocess.run(['alembic', 'upgrade', 'head'], check=True)
+    with get_engine().begin() as txn:
+        txn.execute(text("TRUNCATE incident.incident, incident.incident_category, incident.category, incident.daily_counts"))
+
+
+def ingest(filename: str, workers: int) -> dict:
+    from data_processing.profiling import StageProfiler
+    from data_processing.read_mkdown_file import ShardReader, transform_shards
+    from data_processing.utilities import upload_batches
+
+    profiler = StageProfiler()
+    shards = ShardReader(filename, 64 * 1024 ** 2)
+    stats = upload_batches(transform_shards(shards, True, workers, profiler), profiler=profiler)
+    profiler.record(rows_staged=stats.rows_staged, rows_inserted=stats.rows_inserted,
+                    rows_updated=stats.rows_updated, rows_unchanged=stats.rows_unchanged)
+
+    return profiler.report()
+
+
+def assign_categories() -> None:
+    # severity, labels and categories are normally assigned outside of ingestion; fake them deterministically
+    from sqlalchemy import text
+    from data_processing.daily_counts import refresh_daily_counts
+    from db_utils import get_engine
+
+    with get_engine().begin() as txn:
+        for category, subcategories in bench_categories.items():
+            for subcategory in subcategories:
+                txn.execute(text("INSERT INTO incident.category (category, subcategory) VALUES (:c, :s)"),
+                            {'c': category, 's': subcategory})
+
+        txn.execute(text("""
+            UPDATE incident.incident
+            SET severity = (ARRAY['HIGH', 'MEDIUM', 'LOW'])[1 + abs(hashtext(description_hash)) % 3]
+            , custom_label = (ARRAY['school', 'weekend', 'holiday', NULL])[1 + abs(hashtext(description)) % 4]
+        """))
+        txn.execute(text("""
+            INSERT INTO incident.incident_category (incident_id, category, subcategory)
+            SELECT i.incident_id, c.category, c.subcategory
+            FROM incident.incident i
+            CROSS JOIN LATERAL (
+                SELECT category, subcategory FROM incident.category
+                ORDER BY md5(i.description_hash || subcategory)
+                LIMIT 1 + abs(hashtext(i.description_hash)) % 2
+            ) c
+        """))
+        refresh_daily_counts(txn, touched_only=False)
+
+
+def get_dashboard_queries() -> dict:
+    from streamlit_app import utilities
+
+    loaders = {
+        'category_level_data': utilities.get_category_level_data,
+        'subcategory_level_data': utilities.get_subcategory_level_data,
+        'category_counts': utilities.get_category_counts,
+        'subcategory_options': utilities.get_subcategory_options,
+        'daily_counts': utilities.get_daily_counts,
+    }
+    # time the queries themselves, not the dashboard cache in front of them
+    queries = {name: getattr(loader, '__wrapped__', loader) for name, loader in loaders.items()}
+    queries['category_level_data_high_severity'] = functools.partial(queries['category_level_data'], severity='HIGH')
+    queries['category_level_data_two_subcategories'] = functools.partial(
+        queries['category_level_data'], subcategories=('Medical neglect', 'Police/CPS involvement'))
+    queries['date_bounds'] = utilities.get_date_bounds.__wrapped__
+    queries['incident_page'] = functools.partial(utilities.get_incident_page.__wrapped__, page_size=100)
+    queries['search'] = functools.partial(utilities.search_incidents.__wrapped__, 'pickup late', page_size=100)
+    queries['search_count'] = functools.partial(utilities.count_search_matches.__wrapped__, 'pickup late')
+
+    return queries
+
+
+def time_queries(repeat: int) -> dict:
+    from db_utils import get_engine
+
+    engine = get_engine()
+    results = {}
+    for name, query in get_dashboard_queries().items():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            df = query(engine)
+            timings.append(time.perf_counter() - start)
+        results[name] = {'best_seconds': min(timings), 'seconds': timings, 'rows': len(df)}
+        logging.info(f"{name}: {min(timings):.3f}s, {len(df)} rows")
+
+    return results
+
+
+def run(sizes: list, workers: int, repeat: int) -> dict:
+    from benchmarks.incident_corpus import generate_corpus
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_lines in sizes:
+            logging.info(f"Benchmarking {n_lines} lines...")
+            filename = os.path.join(tmp_dir, f"corpus_{n_lines}.txt")
+            generate_corpus(filename, n_lines)
+
+            reset_database()
+            first_load = ingest(filename, workers)
+            reload = ingest(filename, workers)
+            if reload['metrics']['rows_updated'] or reload['metrics']['rows_inserted']:
+                raise RuntimeError(f"Re-ingesting an unchanged file wrote rows: {reload['metrics']}")
+            assign_categories()
+
+            results[str(n_lines)] = {
+                'ingest': first_load,
+                'reingest_unchanged': reload,
+                'queries': time_queries(repeat),
+            }
+
+    return results
+
+
+def compare(old_file: str, new_file: str) -> None:
+    """
+    Prints how the wall time of each stage and query changed between two result files
+    """
+    with open(old_file) as file:
+        old = json.load(file)
+    with open(new_file) as file:
+        new = json.load(file)
+
+    print(f"{old['commit']} -> {new['commit']}")
+    for size in sorted(set(old['results']) & set(new['results']), key=int):
+        print(f"\n{size} lines")
+        old_size, new_size = old['results'][size], new['results'][size]
+        timings = []
+        for run_name in ['ingest', 'reingest_unchanged']:
+            for stage in new_size[run_name]['stages']:
+                if stage in old_size[run_name]['stages']:
+                    timings.append((f"{run_name}.{stage}", old_size[run_name]['stages'][stage]['wall_seconds'],
+                                    new_size[run_name]['stages'][stage]['wall_seconds']))
+        for query in new_size['queries']:
+            if query in old_size['queries']:
+                timings.append((f"query.{query}", old_size['queries'][query]['best_seconds'],
+                                new_size['queries'][query]['best_seconds']))
+
+        for name, old_seconds, new_seconds in timings:
+            ratio = new_seconds / old_seconds if old_seconds else float('nan')
+            print(f"  {name:45s} {old_seconds:9.3f}s -> {new_seconds:9.3f}s  ({ratio:5.2f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--db-url', type=str, help='Throwaway postgres database to benchmark against')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000],
+                        help='Corpus sizes to benchmark, in lines')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes for parsing')
+    parser.add_argument('--repeat', type=int, default=3, help='Times to run each dashboard query')
+    parser.add_argument('--output-dir', type=str, default='benchmarks/results', help='Where to write results')
+    parser.add_argument('--compare', type=str, nargs=2, metavar=('OLD', 'NEW'),
+                        help='Compare two result files instead of running')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    if not args.db_url:
+        parser.error("--db-url is required")
+    if args.db_url == os.environ.get("LOCAL_DB_URL"):
+        parser.error("--db-url must not be the LOCAL_DB_URL database, since the suite empties it")
+
+    # everything (alembic included) reads the db url from here, so set it before anything connects
+    os.environ["LOCAL_DB_URL"] = args.db_url
+
+    commit = get_commit()
+    results = run(args.sizes, args.workers, args.repeat)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_file = os.path.join(args.output_dir, f"{time.strftime('%Y%m%d_%H%M%S')}_{commit}.json")
+    with open(output_file, 'w') as file:
+        json.dump({'commit': commit, 'run_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'sizes': args.sizes,
+                   'workers': args.workers, 'results': results}, file, indent=2)
+    logging.info(f"Wrote results to {output_file}")
+
+
+if __name__ == '__main__':
+    main()
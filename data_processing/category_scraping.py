@@ -1,7 +1,8 @@
 import logging
 
 import pandas as pd
-from db_utils import get_engine
+from data_processing.daily_counts import create_touched_date_table, refresh_daily_counts
+from db_utils import get_engine, bulk_load
 from sqlalchemy import text
 
 engine = get_engine()
@@ -19,8 +20,7 @@ with engine.begin() as txn:
            subcategory character varying)
        """))
 
-    df[['description_hash', 'subcategory']].to_sql("tmp_incident_category", txn, if_exists='append',
-                                              index=False, chunksize=500, method='multi')
+    bulk_load(txn, df[['description_hash', 'subcategory']], "tmp_incident_category")
 
     r = txn.execute(text("""
         INSERT INTO incident.incident_category as c 
@@ -35,17 +35,39 @@ with engine.begin() as txn:
 
     logging.info(f"Rows upserted: {r.rowcount}")
 
+    # the daily counts are split by category, so recount every date with an incident that was (re)categorized
+    create_touched_date_table(txn)
+    txn.execute(text("""
+        INSERT INTO tmp_touched_date (user_id, date)
+        SELECT DISTINCT i.user_id, i.incident_at::date
+        FROM tmp_incident_category t
+        JOIN incident.incident i on i.description_hash = t.description_hash
+        WHERE i.incident_at is not null
+    """))
+
     txn.execute(text("""DROP TABLE IF EXISTS tmp_incident_category;"""))
 
     r = txn.execute(text("""
-        UPDATE incident.incident_category c
-        SET category = t.category
-        FROM (SELECT ic.incident_id, ic.subcategory, c.category FROM incident.incident_category ic
-            LEFT JOIN incident.category c on c.subcategory = ic.subcategory
-            WHERE ic.category is null) t
-        WHERE t.incident_id = c.incident_id and c.subcategory = t.subcategory
+        WITH updated AS (
+            UPDATE incident.incident_category c
+            SET category = t.category
+            FROM (SELECT ic.incident_id, ic.subcategory, c.category FROM incident.incident_category ic
+                LEFT JOIN incident.category c on c.subcategory = ic.subcategory
+                WHERE ic.category is null) t
+            WHERE t.incident_id = c.incident_id and c.subcategory = t.subcategory
+            RETURNING c.incident_id
+        ), touched AS (
+            INSERT INTO tmp_touched_date (user_id, date)
+            SELECT DISTINCT i.user_id, i.incident_at::date
+            FROM incident.incident i
+            WHERE i.incident_id in (SELECT incident_id FROM updated)
+                and i.incident_at is not null
+        )
+        SELECT count(*) FROM updated
     """))
 
-    logging.info(f"Rows upserted: {r.rowcount}")
+    logging.info(f"Rows upserted: {r.scalar()}")
+
+    refresh_daily_counts(txn)
 
 
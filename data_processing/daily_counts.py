@@ -0,0 +1,106 @@
+import logging
+
+from sqlalchemy import text
+
+from db_utils import get_engine
+
+"""
+Maintains incident.daily_counts: the number of dated incidents per user, day, category, custom label and severity,
+which is all the Heatmap and Timelines pages need.
+
+Rather than rebuilding it, the steps that write incidents record which (user, date) pairs they touched in a temp
+table, `tmp_touched_date`, and only those days are recounted, in the same transaction as the write.  The category
+of a day's row is the same comma separated list of an incident's categories that the dashboard loaders show.
+
+Severity and custom labels are set outside of this pipeline, so after editing those by hand, rebuild everything with
+
+    python -m data_processing.daily_counts
+"""
+
+
+def create_touched_date_table(txn) -> None:
+    txn.execute(text("""
+        CREATE TEMPORARY TABLE IF NOT EXISTS tmp_touched_date (
+            user_id integer,
+            date    date
+        ) ON COMMIT DROP
+    """))
+
+
+def refresh_daily_counts(txn, touched_only: bool = True) -> int:
+    """
+    Recounts incident.daily_counts, within the given transaction.  Counts are upserted on the table's key, and only
+    the rows of recounted days that no longer have any incidents are deleted, so two refreshes of the same day (even
+    at the same time) can never leave it counted twice
+    :param txn: open connection/transaction
+    :param touched_only: only recount the days listed in tmp_touched_date (see `create_touched_date_table`),
+    otherwise rebuild the whole table
+    :return: number of rollup rows written
+    """
+    if touched_only:
+        # the range comparison (rather than incident_at::date = t.date) lets this use the (user_id, incident_at) index
+        touched_join = """
+            JOIN (SELECT DISTINCT user_id, date FROM tmp_touched_date) t on i.user_id = t.user_id
+                and i.incident_at >= t.date and i.incident_at < t.date + 1"""
+        recounted = """
+            and exists (SELECT 1 FROM tmp_touched_date t WHERE t.user_id = d.user_id and t.date = d.date)"""
+    else:
+        touched_join = recounted = ""
+
+    txn.execute(text(f"""
+        CREATE TEMPORARY TABLE tmp_daily_counts ON COMMIT DROP AS
+        SELECT i.user_id
+        , i.incident_at::date as date
+        , c.category
+        , i.custom_label
+        , i.severity
+        , count(*)::integer as n_incidents
+        FROM incident.incident i
+        {touched_join}
+        LEFT JOIN LATERAL (
+            SELECT string_agg(distinct category, ', ') as category
+            FROM incident.incident_category ic
+            WHERE ic.incident_id = i.incident_id
+        ) c on TRUE
+        WHERE i.incident_at is not null
+        GROUP BY 1,2,3,4,5
+    """))
+
+    # combinations a recounted day doesn't have any more
+    txn.execute(text(f"""
+        DELETE FROM incident.daily_counts d
+        WHERE TRUE
+            {recounted}
+            and not exists (
+                SELECT 1 FROM tmp_daily_counts c
+                WHERE c.user_id = d.user_id and c.date = d.date
+                    and c.category is not distinct from d.category
+                    and c.custom_label is not distinct from d.custom_label
+                    and c.severity is not distinct from d.severity)
+    """))
+
+    # counts that didn't change aren't rewritten
+    r = txn.execute(text("""
+        INSERT INTO incident.daily_counts as d (user_id, date, category, custom_label, severity, n_incidents)
+        SELECT user_id, date, category, custom_label, severity, n_incidents
+        FROM tmp_daily_counts
+        ON CONFLICT ON CONSTRAINT daily_counts_key
+        DO UPDATE SET n_incidents = EXCLUDED.n_incidents
+        WHERE d.n_incidents <> EXCLUDED.n_incidents
+    """))
+    logging.info(f"Daily count rows refreshed: {r.rowcount}")
+
+    txn.execute(text("DROP TABLE tmp_daily_counts"))
+
+    return r.rowcount
+
+
+def main():
+    logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
+
+    with get_engine().begin() as txn:
+        refresh_daily_counts(txn, touched_only=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass, asdict
+from typing import Dict, Optional
+
+"""
+Keeps track of what has already been ingested from each incident file, so a re-run only has to parse what is new.
+
+Incident files are normally only ever appended to.  For each file, the manifest stores how far into the file has been
+processed (a byte offset), a checksum of everything up to that offset, and the period header in effect at that
+point.  On the next run:
+
+- a file with the same size and mtime is skipped
+- a file whose first `offset` bytes still match the checksum was appended to, so only the bytes after `offset` are
+  parsed, starting with the stored period header
+- anything else (edited, truncated, or the last line was incomplete) is re-parsed from the beginning
+"""
+
+# bytes read at a time while checksumming
+READ_SIZE = 1024 ** 2
+
+
+@dataclass
+class ManifestEntry:
+    path: str
+    size: int
+    mtime: float
+    checksum: str  # sha256 of the first `offset` bytes
+    offset: int  # how many bytes of the file have been processed
+    period_header: Optional[str]  # the last period header at or before `offset`
+
+
+@dataclass
+class FilePlan:
+    path: str
+    start: int  # byte offset to start parsing from
+    end: int  # byte offset to parse up to (the file size when planned)
+    period_header: Optional[str]  # period header in effect at `start`
+    checksum: 'hashlib._Hash'  # sha256 of the first `start` bytes, for the reader to carry on through `end`
+    mtime: float
+
+
+def update_checksum(checksum, file, n_bytes: int) -> None:
+    # feed the next `n_bytes` of the file into the checksum, a chunk at a time
+    while n_bytes > 0:
+        chunk = file.read(min(READ_SIZE, n_bytes))
+        if not chunk:
+            break
+        checksum.update(chunk)
+        n_bytes -= len(chunk)
+
+
+class IngestionManifest:
+    def __init__(self, manifest_file: str):
+        self.manifest_file = manifest_file
+        self.entries: Dict[str, ManifestEntry] = {}
+        self.pending: Dict[str, ManifestEntry] = {}
+
+        if os.path.exists(manifest_file):
+            with open(manifest_file) as file:
+                self.entries = {path: ManifestEntry(**entry) for path, entry in json.load(file).items()}
+
+    def plan(self, filename: str) -> Optional[FilePlan]:
+        """
+        Works out what part of the file still needs to be parsed
+        :return: the byte range to parse and the period header to start it with, or None if nothing changed
+        """
+        path = os.path.abspath(filename)
+        stat = os.stat(path)
+        entry = self.entries.get(path)
+
+        if entry is not None and entry.size == stat.st_size and entry.mtime == stat.st_mtime:
+            logging.info(f"{filename} is unchanged, skipping")
+            return None
+
+        # only the part processed last time is read here; the reader checksums the rest as it parses it
+        checksum = hashlib.sha256()
+        prefix_ends_with_newline = True
+        if entry is not None and entry.offset <= stat.st_size:
+            with open(path, 'rb') as file:
+                update_checksum(checksum, file, entry.offset)
+                if entry.offset > 0:
+                    # if the last line processed had no newline, anything appended is a continuation of that line
+                    file.seek(entry.offset - 1)
+                    prefix_ends_with_newline = file.read(1) == b'\n'
+
+        plan = FilePlan(path, 0, stat.st_size, None, hashlib.sha256(), stat.st_mtime)
+        if entry is None:
+            logging.info(f"{filename} is new, parsing all of it")
+        elif checksum.hexdigest() == entry.checksum and prefix_ends_with_newline:
+            plan.start = entry.offset
+            plan.period_header = entry.period_header
+            plan.checksum = checksum
+            logging.info(f"{filename} was appended to, parsing the {plan.end - plan.start} new bytes")
+        else:
+            logging.info(f"{filename} was edited, parsing all of it again")
+
+        return plan
+
+    def record(self, plan: FilePlan, period_header: Optional[str]) -> None:
+        """
+        Notes that the planned part of the file was parsed, by then with `plan.checksum` covering all of it, and
+        `period_header` being the last header read.  This only sticks once `save` is called, which should be after
+        the upload has been committed.
+        """
+        self.pending[plan.path] = ManifestEntry(plan.path, plan.end, plan.mtime, plan.checksum.hexdigest(), plan.end,
+                                                period_header)
+
+    def save(self) -> None:
+        self.entries.update(self.pending)
+        self.pending = {}
+        with open(self.manifest_file, 'w') as file:
+            json.dump({path: asdict(entry) for path, entry in self.entries.items()}, file, indent=2)
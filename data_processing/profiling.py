@@ -0,0 +1,132 @@
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from typing import Dict, Iterable, Iterator, Optional, TypeVar
+
+"""
+Lightweight per-stage profiling for the ingestion pipeline: wall time, CPU time, peak memory and row counts for each
+stage, written out as a JSON report.
+
+CPU time is per thread, so stages running in the pipelined uploader thread are counted correctly.  Peak memory is
+traced with tracemalloc, which slows allocation down a bit, so it is only on while profiling.  Its peak is
+process-wide, and is reset at the start of each stage, so it only means something while stages run one at a time:
+when they overlap across threads (the pipelined uploader), peak memory tracking has to be turned off, and the report
+says it was.
+Stages that run in worker processes are profiled there and merged in: their times are summed across workers, so
+they can add up to more than the elapsed time.
+"""
+
+T = TypeVar('T')
+
+
+@dataclass
+class StageStats:
+    calls: int = 0
+    rows: int = 0
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    peak_memory_bytes: Optional[int] = None  # highest traced memory seen during any one call of the stage
+
+    def merge(self, other: 'StageStats') -> None:
+        self.calls += other.calls
+        self.rows += other.rows
+        self.wall_seconds += other.wall_seconds
+        self.cpu_seconds += other.cpu_seconds
+        if other.peak_memory_bytes is not None:
+            self.peak_memory_bytes = max(self.peak_memory_bytes or 0, other.peak_memory_bytes)
+
+
+class StageProfiler:
+    def __init__(self, enabled: bool = True, track_peak_memory: bool = True):
+        """
+        :param enabled: if False, nothing is recorded
+        :param track_peak_memory: whether to trace each stage's peak memory; only valid if no two stages ever run at
+        the same time in this process
+        """
+        self.enabled = enabled
+        self.track_peak_memory = enabled and track_peak_memory
+        self.stages: Dict[str, StageStats] = {}
+        self.metrics: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+        if self.track_peak_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name: str, rows: int = 0):
+        """
+        Times everything in the `with` block as one call of the stage
+        """
+        if not self.enabled:
+            yield
+            return
+
+        if self.track_peak_memory:
+            tracemalloc.reset_peak()
+        start_wall, start_cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            stats = StageStats(1, rows, time.perf_counter() - start_wall, time.thread_time() - start_cpu,
+                               tracemalloc.get_traced_memory()[1] if self.track_peak_memory else None)
+            self.merge({name: stats})
+
+    def iterate(self, name: str, items: Iterable[T], count_rows=len) -> Iterator[T]:
+        """
+        Times how long each item takes to produce (e.g. each batch read from a file) as a call of the stage
+        """
+        if not self.enabled:
+            yield from items
+            return
+
+        iterator = iter(items)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            self.add_rows(name, count_rows(item))
+            yield item
+
+    def add_rows(self, name: str, rows: int) -> None:
+        """
+        For stages where the row count is only known after the fact
+        """
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self.stages.setdefault(name, StageStats()).rows += rows
+
+    def merge(self, stages: Dict[str, StageStats]) -> None:
+        with self._lock:
+            for name, stats in stages.items():
+                self.stages.setdefault(name, StageStats()).merge(stats)
+
+    def record(self, **metrics: int) -> None:
+        """
+        Stores counts that don't belong to a single stage (e.g., rows inserted by the upsert)
+        """
+        with self._lock:
+            self.metrics.update(metrics)
+
+    def report(self) -> dict:
+        return {
+            'total_wall_seconds': time.perf_counter() - self._start,
+            'peak_memory_tracked': self.track_peak_memory,
+            'stages': {name: asdict(stats) for name, stats in self.stages.items()},
+            'metrics': self.metrics,
+        }
+
+    def write_report(self, report_file: str) -> None:
+        with open(report_file, 'w') as file:
+            json.dump(self.report(), file, indent=2)
+
+
+# used wherever no profiler is passed in, so profiling is always optional and costs nothing when off
+NULL_PROFILER = StageProfiler(enabled=False)
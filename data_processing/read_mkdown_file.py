@@ -1,11 +1,24 @@
 import argparse
+import cProfile
+import glob
+import hashlib
+import io
 import logging
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict
+from functools import partial
+from typing import Dict, Iterable, Iterator, List, Optional
 
 import numpy as np
 import pandas as pd
-import hashlib
 
-from data_processing.utilities import get_period_boundaries, extract_possible_incident_date, estimate_date, upload_data
+from db_utils import LOAD_METHODS, get_pool_stats
+from data_processing.manifest import IngestionManifest
+from data_processing.profiling import StageProfiler, StageStats, NULL_PROFILER
+from data_processing.utilities import get_period_boundaries, parse_incidents, estimate_dates, upload_batches, \
+    upload_batches_pipelined, IncidentFingerprints
 
 logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
 
@@ -28,6 +41,9 @@ be estimated in the following way:
 2. if a month is given only, then a random date within that month will be used
 3. if no date is given, a random date within the chunk's time period will be used
 
+"Random" dates are seeded from each incident's own description and period, so an incident keeps the same date
+every time the file is re-ingested, even if other lines in the file change.
+
 # Chunk's Individual Structure
 Each row in the data is either:
 
@@ -48,38 +64,71 @@ can also include lower and upper case letters
 
 """
 
-# set seed for same results
-np.random.seed(47)
 
+def clean_incident_line(incident: str) -> str:
+    # clean up newline metadata
+    return incident.strip('\n').strip('\t').strip("-")
 
-def read_data_into_raw_df(filename: str) -> pd.DataFrame:
-    with open(filename) as file:
-        incidents = file.readlines()
 
-    # remove blank lines, clean up newline metadata
-    incidents_cleaned = [incident.strip('\n').strip('\t').strip("-") for incident in incidents if incident != '\n']
+def clean_incident_lines(incidents: Iterable[str]) -> Iterator[str]:
+    for incident in incidents:
+        # remove blank lines
+        if incident != '\n':
+            yield clean_incident_line(incident)
 
-    # convert to dataframe
-    return pd.DataFrame(incidents_cleaned, columns=['full_incident'])
+
+def iter_raw_incidents(filename: str) -> Iterator[str]:
+    # read lazily, line by line, so the whole file never has to sit in memory
+    with open(filename) as file:
+        yield from clean_incident_lines(file)
 
 
-def transform_data_for_upload(incident_df: pd.DataFrame, infer_dates: bool) -> pd.DataFrame:
+def read_data_into_raw_df(filename: str) -> pd.DataFrame:
+    # convert to dataframe
+    return pd.DataFrame(list(iter_raw_incidents(filename)), columns=['full_incident'])
+
+
+def iter_raw_batches(filename: str, batch_size: int) -> Iterator[pd.DataFrame]:
+    """
+    Streams the file as a series of raw data frames with (at most) `batch_size` incidents each.  The most recent
+    period header is carried over to the top of the next batch, so each batch can be transformed on its own and
+    still get the same period boundaries it would have gotten if the whole file were read at once.
+    """
+    period_header = None
+    batch = []
+    n_incidents = 0
+    for incident in iter_raw_incidents(filename):
+        batch.append(incident)
+        if incident.startswith('#'):
+            period_header = incident
+            continue
+
+        n_incidents += 1
+        if n_incidents >= batch_size:
+            yield pd.DataFrame(batch, columns=['full_incident'])
+            batch = [] if period_header is None else [period_header]
+            n_incidents = 0
+
+    if n_incidents > 0:
+        yield pd.DataFrame(batch, columns=['full_incident'])
+
+
+def transform_data_for_upload(incident_df: pd.DataFrame, infer_dates: bool,
+                              profiler: StageProfiler = NULL_PROFILER) -> pd.DataFrame:
     # transform the data into only a list of incidents and a period start and end
-    incident_df = get_period_boundaries(incident_df)
+    with profiler.stage('get_period_boundaries', len(incident_df)):
+        incident_df = get_period_boundaries(incident_df)
+
+    # pull out any dates given, and clean up + hash the description, all in one columnar pass
+    incident_df = parse_incidents(incident_df, profiler)
 
-    incident_df['parsed_date'] = incident_df.full_incident.apply(extract_possible_incident_date)
     if infer_dates:
-        incident_df['incident_at'] = incident_df \
-            .apply(lambda x: estimate_date(x.parsed_date, x.period_start_date, x.period_end_date), axis=1)
+        with profiler.stage('date_estimation', len(incident_df)):
+            incident_df['incident_at'] = estimate_dates(incident_df.parsed_date, incident_df.period_start_date,
+                                                        incident_df.period_end_date, incident_df.description_hash)
     else:
         incident_df['incident_at'] = np.nan
 
-    incident_df['description'] = incident_df \
-        .apply(lambda x: x.full_incident.replace(x.parsed_date or '', '').replace('[]', '').strip(' ').strip('.'),
-               axis=1)
-    incident_df['description_hash'] = incident_df['description'] \
-        .apply(lambda x: hashlib.sha256(x.encode('utf-8')).hexdigest())
-
     # get into format for db insertion
     incident_df['user_id'] = 1
 
@@ -90,13 +139,212 @@ def transform_data_for_upload(incident_df: pd.DataFrame, infer_dates: bool) -> p
     return incident_df[['user_id', 'incident_at', 'description', 'description_hash']]
 
 
+# what counts as an incident file when a directory is given
+INCIDENT_FILE_PATTERNS = ['*.txt', '*.md']
+
+
+@dataclass
+class Shard:
+    filename: str
+    start: int  # byte offset of the first line
+    end: int  # byte offset just past the last line
+    data: bytes  # the shard's lines, as read from the file
+    period_header: Optional[str] = None  # header in effect at `start`, if the shard doesn't begin with its own
+
+
+def resolve_input_files(filename: str) -> List[str]:
+    """
+    Expands a file, directory, or glob pattern into the (sorted) list of incident files to read
+    """
+    if os.path.isdir(filename):
+        filenames = [f for pattern in INCIDENT_FILE_PATTERNS for f in glob.glob(os.path.join(filename, pattern))]
+    elif any(c in filename for c in '*?['):
+        filenames = glob.glob(filename, recursive=True)
+    else:
+        filenames = [filename]
+
+    if not filenames:
+        raise ValueError(f"No incident files found for {filename}")
+
+    return sorted(filenames)
+
+
+class ShardReader:
+    """
+    Reads a file (or the part of it between `start` and `end`) front to back, once, handing it out as pieces of
+    roughly `shard_size` bytes that can be parsed independently.  Cuts are only made right before a period header,
+    because period boundaries are only ever carried forward within a period, so a shard that starts with its own
+    header parses exactly as it would as part of the whole file.  If `start` is partway through a period, that
+    period's header is passed in and given to the first shard.
+    """
+
+    def __init__(self, filename: str, shard_size: int, start: int = 0, end: int = None, period_header: str = None,
+                 checksum: 'hashlib._Hash' = None):
+        self.filename = filename
+        self.shard_size = shard_size
+        self.start = start
+        self.end = end
+        self.period_header = period_header  # the header in effect at wherever reading has got to
+        self.checksum = checksum  # if given, every byte read is also fed into it
+
+    def __iter__(self) -> Iterator[Shard]:
+        end = os.path.getsize(self.filename) if self.end is None else self.end
+        shard_start, shard_header = self.start, self.period_header
+        lines, n_bytes = [], 0
+
+        with open(self.filename, 'rb') as file:
+            file.seek(self.start)
+            offset = self.start
+            while offset < end:
+                # never read past `end`, even if the file has been appended to since
+                line = file.readline(end - offset)
+                if not line:
+                    break
+
+                if is_period_header(line):
+                    if lines and n_bytes >= self.shard_size:
+                        yield self.make_shard(shard_start, offset, lines, shard_header)
+                        shard_start, shard_header = offset, None
+                        lines, n_bytes = [], 0
+                    self.period_header = clean_incident_line(line.decode(errors='replace'))
+
+                lines.append(line)
+                n_bytes += len(line)
+                offset += len(line)
+
+        if lines:
+            yield self.make_shard(shard_start, offset, lines, shard_header)
+
+    def make_shard(self, start: int, end: int, lines: List[bytes], period_header: Optional[str]) -> Shard:
+        data = b''.join(lines)
+        if self.checksum is not None:
+            self.checksum.update(data)
+
+        return Shard(self.filename, start, end, data, period_header)
+
+
+def is_period_header(line: bytes) -> bool:
+    return clean_incident_line(line.decode(errors='replace')).startswith('#')
+
+
+def read_shard_into_raw_df(shard: Shard) -> pd.DataFrame:
+    # decode the same way `open` would have, newline handling included
+    incidents = list(clean_incident_lines(io.TextIOWrapper(io.BytesIO(shard.data))))
+    if shard.period_header is not None:
+        incidents.insert(0, shard.period_header)
+
+    return pd.DataFrame(incidents, columns=['full_incident'])
+
+
+def transform_shard(shard: Shard, infer_dates: bool, profiler: StageProfiler = NULL_PROFILER) -> pd.DataFrame:
+    with profiler.stage('read'):
+        incident_df = read_shard_into_raw_df(shard)
+    profiler.add_rows('read', len(incident_df))
+
+    return transform_data_for_upload(incident_df, infer_dates, profiler)
+
+
+def transform_shard_profiled(shard: Shard, infer_dates: bool) -> (pd.DataFrame, Dict[str, StageStats]):
+    # for worker processes, which can't share the main process' profiler: profile locally and send the stats back
+    profiler = StageProfiler()
+    return transform_shard(shard, infer_dates, profiler), profiler.stages
+
+
+def transform_shards(shards: Iterable[Shard], infer_dates: bool, workers: int,
+                     profiler: StageProfiler = NULL_PROFILER) -> Iterator[pd.DataFrame]:
+    """
+    Transforms each shard, in a pool of worker processes if there is more than one worker.  Results come back in
+    shard order regardless, so the output doesn't depend on the number of workers.  Shards are read ahead of the
+    workers, but only a couple per worker, so the file is never all in memory at once.
+    """
+    if workers <= 1:
+        for shard in shards:
+            yield transform_shard(shard, infer_dates, profiler)
+        return
+
+    def get_result(future) -> pd.DataFrame:
+        if not profiler.enabled:
+            return future.result()
+
+        upload_df, stages = future.result()
+        profiler.merge(stages)
+        return upload_df
+
+    transform = partial(transform_shard_profiled if profiler.enabled else transform_shard, infer_dates=infer_dates)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for shard in shards:
+            pending.append(pool.submit(transform, shard))
+            if len(pending) >= 2 * workers:
+                yield get_result(pending.popleft())
+
+        while pending:
+            yield get_result(pending.popleft())
+
+
+def iter_shards(filenames: List[str], shard_size: int, manifest: IngestionManifest = None) -> Iterator[Shard]:
+    """
+    Shards of every file, in order.  With a manifest, only the part of each file that's new since the last run
+    """
+    for f in filenames:
+        if manifest is None:
+            yield from ShardReader(f, shard_size)
+            continue
+
+        # only parse what's new since the last run.  the reader finishes the plan's checksum and finds the last
+        # period header on its way through, so the file doesn't have to be read again for either
+        plan = manifest.plan(f)
+        if plan is not None:
+            reader = ShardReader(f, shard_size, plan.start, plan.end, plan.period_header, plan.checksum)
+            yield from reader
+            manifest.record(plan, reader.period_header)
+
+
 def main():
     parser = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter)
-    parser.add_argument('--filename', type=str, help='Specify raw markdown file to read from')
+    parser.add_argument('--filename', type=str, help='Specify raw markdown file to read from.  Can also be a '
+                                                     'directory, or a glob pattern (quoted) matching several files')
     parser.add_argument('--infer-dates', help='Add if want to estimate dates from headers',
                         action='store_true', default=False)
+    parser.add_argument('--stream', help='Add to read, transform and upload the file in batches, '
+                                         'to keep memory flat for very large files',
+                        action='store_true', default=False)
+    parser.add_argument('--batch-size', type=int, default=100_000,
+                        help='Number of incidents per batch when streaming (default: 100,000)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes to parse files with, when not streaming (default: 1)')
+    parser.add_argument('--shard-size', type=int, default=64,
+                        help='Split files bigger than this many MB at period headers, so they can be parsed in '
+                             'parallel (default: 64)')
+    parser.add_argument('--manifest', type=str, default=None,
+                        help='Local state file tracking what has already been ingested from each file.  If given, '
+                             'unchanged files are skipped and only the appended part of a file is parsed')
+    parser.add_argument('--load-method', choices=LOAD_METHODS, default=None,
+                        help='How to load the temp table: postgres COPY, or pandas to_sql (default: copy, or '
+                             'THRIVE_LOAD_METHOD if set)')
+    parser.add_argument('--delta', help='Add to only upload incidents that are new or changed, compared to what is '
+                                        'already in the db',
+                        action='store_true', default=False)
+    parser.add_argument('--fingerprint-cache', type=str, default=None,
+                        help='With --delta, a local file of already uploaded incidents to compare against instead '
+                             'of querying the db.  It is created if missing and updated after each upload, so it '
+                             'is only valid as long as nothing else writes to the incident table')
+
+    parser.add_argument('--pipeline', help='Add to upload in a separate thread while parsing continues, instead of '
+                                           'parsing and uploading taking turns',
+                        action='store_true', default=False)
+    parser.add_argument('--queue-size', type=int, default=4,
+                        help='With --pipeline, how many parsed batches can wait for the uploader (default: 4)')
+    parser.add_argument('--profile', type=str, default=None,
+                        help='Write wall time, CPU time, peak memory (not with --pipeline) and row counts per stage to '
+                             'this JSON file')
+    parser.add_argument('--cprofile', type=str, default=None,
+                        help='Write a cProfile dump (readable with pstats) to this file')
 
     args = parser.parse_args()
+    if args.manifest and args.stream:
+        parser.error("--manifest can't be combined with --stream")
+
     if args.filename:
         filename = args.filename
     else:
@@ -104,15 +352,55 @@ def main():
         filename = 'data/incidents.txt'
 
     infer_dates = True if args.infer_dates else False
+    filenames = resolve_input_files(filename)
+
+    # tracemalloc's peak is process-wide, so per-stage peaks can't be told apart once the uploader thread's stages
+    # overlap the parsing ones
+    profiler = StageProfiler(track_peak_memory=not args.pipeline) if args.profile else NULL_PROFILER
+    if args.cprofile:
+        c_profiler = cProfile.Profile()
+        c_profiler.enable()
+
+    if args.stream:
+        logging.info(f"Streaming data from {len(filenames)} file(s) in batches of {args.batch_size}...")
+        upload_dfs = (transform_data_for_upload(incident_df, infer_dates, profiler)
+                      for f in filenames
+                      for incident_df in profiler.iterate('read', iter_raw_batches(f, args.batch_size)))
+    else:
+        manifest = IngestionManifest(args.manifest) if args.manifest else None
+        logging.info(f"Reading and transforming data from {len(filenames)} file(s), in shards of {args.shard_size} "
+                     f"MB with {args.workers} worker(s)...")
+        upload_dfs = transform_shards(iter_shards(filenames, args.shard_size * 1024 ** 2, manifest), infer_dates,
+                                      args.workers, profiler)
+
+    fingerprints = None
+    if args.delta:
+        logging.info("Getting fingerprints of incidents already in db...")
+        fingerprints = IncidentFingerprints.load(args.fingerprint_cache)
+        upload_dfs = (fingerprints.filter_changed(upload_df) for upload_df in upload_dfs)
+
+    if args.pipeline:
+        logging.info("Uploading data into db as it is parsed...")
+        stats = upload_batches_pipelined(upload_dfs, args.load_method, args.queue_size, profiler)
+    else:
+        logging.info("Uploading data into db...")
+        stats = upload_batches(upload_dfs, args.load_method, profiler)
+
+    if fingerprints is not None and args.fingerprint_cache:
+        fingerprints.save(args.fingerprint_cache)
 
-    logging.info(f"Reading data from {filename}..")
-    incident_df = read_data_into_raw_df(filename)
+    if args.manifest:
+        manifest.save()
 
-    logging.info("Transforming data...")
-    upload_df = transform_data_for_upload(incident_df, infer_dates)
+    if args.cprofile:
+        c_profiler.disable()
+        c_profiler.dump_stats(args.cprofile)
+        logging.info(f"Wrote cProfile stats to {args.cprofile}")
 
-    logging.info("Uploading data into db...")
-    upload_data(upload_df)
+    if args.profile:
+        profiler.record(**asdict(stats), rows_unchanged=stats.rows_unchanged, pool=get_pool_stats())
+        profiler.write_report(args.profile)
+        logging.info(f"Wrote profile to {args.profile}")
 
 
 if __name__ == '__main__':
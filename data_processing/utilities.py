@@ -1,17 +1,21 @@
 import calendar
-import datetime
+import hashlib
 import logging
+import os
+import queue
 import re
-from dataclasses import dataclass
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, Optional
 
 import numpy as np
 import pandas as pd
 from pandas.tseries.offsets import MonthEnd
 from sqlalchemy import text
 
-from db_utils import get_engine
-
-engine = get_engine()
+from data_processing.daily_counts import create_touched_date_table, refresh_daily_counts
+from data_processing.profiling import StageProfiler, NULL_PROFILER
+from db_utils import get_engine, bulk_load
 
 
 # this is super overkill perhaps, but fun to see these in action
@@ -19,6 +23,10 @@ engine = get_engine()
 class PatternGroup:
     pattern: str  # regex pattern to match on string
     group: int  # which group to extract of matched pattern
+    regex: re.Pattern = field(init=False, repr=False)  # compiled once, since it gets run on every row
+
+    def __post_init__(self):
+        self.regex = re.compile(self.pattern)
 
 
 def get_period_boundaries(incident_df: pd.DataFrame) -> pd.DataFrame:
@@ -52,114 +60,473 @@ def get_period_boundaries(incident_df: pd.DataFrame) -> pd.DataFrame:
     return incident_df
 
 
-def extract_possible_incident_date(s: str) -> str:
-    # look for dates given possible patterns:  e.g., "[oct 22]", "january 28."
-    patterns = [
-        PatternGroup(r"^\s*\[(.*?)\]", 1),  # brackets
-        PatternGroup(r"^\s*(\w+(\s+\w+)?)\.", 0)  # no brackets
-    ]
+# look for dates given possible patterns:  e.g., "[oct 22]", "january 28.".  Order matters: the first match wins
+INCIDENT_DATE_PATTERNS = [
+    PatternGroup(r"^\s*\[(.*?)\]", 1),  # brackets
+    PatternGroup(r"^\s*(\w+(\s+\w+)?)\.", 0)  # no brackets
+]
+
 
-    for pattern in patterns:
-        match = re.search(pattern.pattern, s)
-        if match:
-            return match.group(pattern.group).strip('.').strip(' ')
+def extract_possible_incident_dates(full_incident: pd.Series) -> pd.Series:
+    """
+    Pulls the possible date out of each incident, in one pass over the raw values with the precompiled patterns (no
+    per-row Series are built, unlike `.apply`).  The first pattern that matches wins
+    :param full_incident: raw incident strings
+    :return: the parsed date string for each incident, or None if there is no date given
+    """
+    def first_match(s: str) -> Optional[str]:
+        for pattern in INCIDENT_DATE_PATTERNS:
+            match = pattern.regex.search(s)
+            if match:
+                return match.group(pattern.group).strip('.').strip(' ')
+        return None
 
-    return None
+    return pd.Series([first_match(s) for s in full_incident], index=full_incident.index, dtype=object)
 
 
-def estimate_date(parsed_date: str, period_start_date: pd.Timestamp, period_end_date: pd.Timestamp) -> pd.Timestamp:
+def strip_descriptions(full_incident: pd.Series, parsed_date: pd.Series) -> pd.Series:
     """
-    Figure out what the estimated date could be.  If only the time period is given, give a random date
-    within that.  If not, guess which year it may belong to (because some time periods overlap the end and
-    beginnings of the year).  Probably a slicker way to do this, but this was a quick and easy one.
+    Removes the parsed date (wherever it appears) and any leftover brackets/punctuation from each incident
     """
-    if parsed_date is None:
-        return pd.Timestamp(np.random.uniform(period_start_date.to_datetime64(), period_end_date.to_datetime64()))
+    return pd.Series([incident.replace(date or '', '').replace('[]', '').strip(' ').strip('.')
+                      for incident, date in zip(full_incident, parsed_date)],
+                     index=full_incident.index, dtype=object)
 
-    first_try_year = estimate_date_for_given_year(parsed_date, period_start_date)
-    if period_start_date <= first_try_year <= period_end_date:
-        return pd.to_datetime(first_try_year)
 
-    second_try_year = estimate_date_for_given_year(parsed_date, period_end_date)
-    if period_start_date <= second_try_year <= period_end_date:
-        return pd.to_datetime(second_try_year)
+def hash_descriptions(description: pd.Series) -> pd.Series:
+    """
+    sha256 hex digest of each description, used to identify an incident across uploads
+    """
+    sha256 = hashlib.sha256
+    return pd.Series([sha256(d.encode('utf-8')).hexdigest() for d in description],
+                     index=description.index, dtype=object)
 
-    raise ValueError(f"Cannot find adequate date for {parsed_date} between {period_start_date} and {period_end_date}")
 
+def parse_incidents(incident_df: pd.DataFrame, profiler: StageProfiler = NULL_PROFILER) -> pd.DataFrame:
+    """
+    Parses each raw incident into its (possible) date, its description with the date removed, and a hash of
+    that description.  Each step runs over the whole column at once rather than through a row-wise `.apply`.
+    :param incident_df: data frame with a `full_incident` column
+    :param profiler: optionally, where to record how long each step takes
+    :return: the same data frame, with `parsed_date`, `description`, and `description_hash` columns added
+    """
+    n_rows = len(incident_df)
+    with profiler.stage('date_extraction', n_rows):
+        incident_df['parsed_date'] = extract_possible_incident_dates(incident_df.full_incident)
+    with profiler.stage('description_cleanup', n_rows):
+        incident_df['description'] = strip_descriptions(incident_df.full_incident, incident_df.parsed_date)
+    with profiler.stage('hashing', n_rows):
+        incident_df['description_hash'] = hash_descriptions(incident_df.description)
 
-def estimate_date_for_given_year(parsed_date: str, period_date: pd.Timestamp) -> datetime.datetime:
+    return incident_df
+
+
+# month name or abbreviation (as written in the incident, capitalized) -> month number, e.g. "Jan"/"January" -> 1
+MONTH_LOOKUP = {**{name: num for num, name in enumerate(calendar.month_name) if name},
+                **{abbr: num for num, abbr in enumerate(calendar.month_abbr) if abbr}}
+
+
+def get_incident_random_fractions(description_hash: pd.Series, period_start_date: pd.Series,
+                                  period_end_date: pd.Series) -> pd.Series:
     """
-    For a given year, what would the actual timestamp be?
+    A "random" number in [0, 1) for each incident, derived from the incident itself (its description hash and
+    period) rather than from a global random state.  This way, an incident gets the same estimated date every
+    time it is ingested, no matter what else was added to or removed from the file around it.
     """
-    year = period_date.year
+    sha256 = hashlib.sha256
+    seeds = [sha256(f"{h}|{start}|{end}".encode('utf-8')).digest() for h, start, end
+             in zip(description_hash, period_start_date.astype(str), period_end_date.astype(str))]
 
-    split_parsed_date = parsed_date.split(" ")
-    month = split_parsed_date[0].capitalize()
+    # top 53 bits of the digest -> a float with every bit of precision a double has
+    return pd.Series([(int.from_bytes(seed[:8], 'big') >> 11) / 2 ** 53 for seed in seeds],
+                     index=description_hash.index, dtype=float)
 
-    if month in calendar.month_name:
-        month_format = "%B"
-    elif month in calendar.month_abbr:
-        month_format = "%b"
-    else:
-        raise ValueError(f"Cannot find valid month from {month}")
 
-    month_num = datetime.datetime.strptime(month, month_format).month
+def estimate_dates(parsed_date: pd.Series, period_start_date: pd.Series, period_end_date: pd.Series,
+                   description_hash: pd.Series) -> pd.Series:
+    """
+    Figure out what the estimated date could be, for a whole column of incidents at once.  If only the time period
+    is given, give a random date within that.  If not, guess which year it may belong to (because some time periods
+    overlap the end and beginnings of the year): the period's start year is tried first, then its end year.  If
+    only a month is given, the day is random within that month.  "Random" here is seeded per incident (see
+    `get_incident_random_fractions`), so re-ingesting the same incident always gives the same date.
+    :param parsed_date: date strings pulled out of each incident (e.g. "Jan 28", "august"), or None
+    :param period_start_date: start of the period each incident is in
+    :param period_end_date: end of the period each incident is in
+    :param description_hash: hash of each incident's description
+    :return: estimated timestamp for each incident
+    """
+    period_start_date = pd.to_datetime(period_start_date)
+    period_end_date = pd.to_datetime(period_end_date)
+    is_undated = parsed_date.isna()
+
+    # one draw per row, for the position within the period (undated) or within the month (month only)
+    random_fraction = get_incident_random_fractions(description_hash, period_start_date, period_end_date)
+
+    # no date given: anywhere in the period.  this is truncated to microseconds, since that is all the db keeps, and
+    # otherwise a re-ingested timestamp would never exactly match the stored one
+    period_ns = (period_end_date - period_start_date).to_numpy(dtype='timedelta64[ns]').astype(np.int64)
+    offset_ns = (random_fraction.to_numpy() * period_ns).astype(np.int64)
+    incident_at = (period_start_date + pd.to_timedelta(offset_ns, unit='ns')).dt.floor('us').where(is_undated)
+
+    # date given: split out month and (maybe) day
+    split_parsed_date = parsed_date.str.split(" ")
+    month_num = split_parsed_date.str[0].astype(object).str.capitalize().map(MONTH_LOOKUP)
+    day_str = split_parsed_date.str[1].astype(object)  # stays a string column even if no incident has a day
+    has_day = day_str.str.isnumeric().eq(True)
+    given_day = pd.to_numeric(day_str.where(has_day), errors='coerce')
+
+    for period_date in [period_start_date, period_end_date]:
+        first_of_month = pd.to_datetime(pd.DataFrame({'year': period_date.dt.year, 'month': month_num, 'day': 1}),
+                                        errors='coerce')
+        days_in_month = first_of_month.dt.days_in_month
+        day = given_day.where(has_day, np.floor(random_fraction * days_in_month) + 1)
+
+        # an impossible day (e.g. "Feb 30", "Jan 0") comes out as NaT, and so never lands in the period
+        try_date = first_of_month + pd.to_timedelta(day.where((day >= 1) & (day <= days_in_month)) - 1, unit='D')
+        use_try_date = ~is_undated & incident_at.isna() \
+            & (period_start_date <= try_date) & (try_date <= period_end_date)
+        incident_at = incident_at.where(~use_try_date, try_date)
+
+    unresolved = incident_at.isna()
+    if unresolved.any():
+        raise ValueError(f"Cannot find adequate date for {unresolved.sum()} incident(s):\n"
+                         + report_unresolved_dates(parsed_date[unresolved], period_start_date[unresolved],
+                                                   period_end_date[unresolved]))
+
+    return incident_at
+
+
+def report_unresolved_dates(parsed_date: pd.Series, period_start_date: pd.Series, period_end_date: pd.Series,
+                            max_rows: int = 20) -> str:
+    """
+    Lists the incidents that `estimate_dates` could not place, for an error message
+    """
+    report_df = pd.DataFrame({'parsed_date': parsed_date, 'period_start_date': period_start_date,
+                              'period_end_date': period_end_date})
+    report = report_df.head(max_rows).to_string()
+    if len(report_df) > max_rows:
+        report += f"\n... and {len(report_df) - max_rows} more"
 
-    if len(split_parsed_date) > 1 and split_parsed_date[1].isnumeric():
-        day = int(split_parsed_date[1])
-    else:
-        # need to estimate day
-        last_day_of_month = calendar.monthrange(year, month_num)[1]
-        day = np.random.randint(1, last_day_of_month + 1)
+    return report
 
-    return datetime.datetime(year, month_num, day)
 
+class IncidentFingerprints:
+    """
+    A compact record of what is already in the db, per incident: description hash -> incident_at.  This is used to
+    drop unchanged incidents before they are uploaded at all, since on a typical re-ingest nearly all of them are
+    unchanged.  (The upsert would leave them alone anyway, but they would still go through the temp table.)
+    """
 
-def upload_data(upload_df: pd.DataFrame) -> None:
+    def __init__(self, fingerprints: Dict[str, str]):
+        self.fingerprints = fingerprints
+        # incident_at of the earliest copy of each incident seen so far this run, which is the one the upsert keeps
+        self.earliest: Dict[str, str] = {}
+
+    @staticmethod
+    def format_incident_at(incident_at: pd.Series) -> pd.Series:
+        # microsecond precision, same as the db; no date is an empty string
+        return pd.to_datetime(incident_at).dt.strftime('%Y-%m-%d %H:%M:%S.%f').fillna('')
+
+    @classmethod
+    def from_db(cls, user_id: int = 1) -> 'IncidentFingerprints':
+        # cast to timestamp (without time zone) so it is in the session's time zone, which is also how the naive
+        # timestamps being uploaded get interpreted
+        fingerprint_df = pd.read_sql(text("""
+            SELECT description_hash, incident_at::timestamp as incident_at
+            FROM incident.incident
+            WHERE user_id = :user_id
+        """), get_engine(), params={'user_id': user_id})
+
+        return cls(dict(zip(fingerprint_df.description_hash, cls.format_incident_at(fingerprint_df.incident_at))))
+
+    @classmethod
+    def from_cache(cls, cache_file: str) -> 'IncidentFingerprints':
+        with open(cache_file) as file:
+            return cls(dict(line.rstrip('\n').split('\t') for line in file))
+
+    @classmethod
+    def load(cls, cache_file: str = None, user_id: int = 1) -> 'IncidentFingerprints':
+        """
+        Reads fingerprints from the cache file if there is one, otherwise from the db
+        """
+        if cache_file is not None and os.path.exists(cache_file):
+            fingerprints = cls.from_cache(cache_file)
+            logging.info(f"Read {len(fingerprints.fingerprints)} fingerprints from {cache_file}")
+        else:
+            fingerprints = cls.from_db(user_id)
+            logging.info(f"Read {len(fingerprints.fingerprints)} fingerprints from db")
+
+        return fingerprints
+
+    @staticmethod
+    def is_earlier(incident_at: str, than: str) -> bool:
+        # no date sorts last, the same as in the upsert
+        return incident_at != '' and (than == '' or incident_at < than)
+
+    def filter_changed(self, upload_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Keeps only incidents that are new or whose incident_at changed (a changed description is a new hash), and
+        records them as uploaded.  Only the earliest copy of an incident seen this run is compared (descriptions are
+        hashed without their dates, so the same one can turn up at several dates), since that is the copy the
+        upsert keeps; otherwise the stored date would move to another copy's on every run
+        """
+        n_rows = len(upload_df)
+        upload_df = drop_duplicate_incidents(upload_df)
+        incident_at = self.format_incident_at(upload_df.incident_at)
+
+        is_changed = np.zeros(len(upload_df), dtype=bool)
+        for i, (h, t) in enumerate(zip(upload_df.description_hash, incident_at)):
+            earliest = self.earliest.get(h)
+            if earliest is not None and not self.is_earlier(t, earliest):
+                continue
+            self.earliest[h] = t
+            is_changed[i] = self.fingerprints.get(h) != t
+
+        changed_df = upload_df[is_changed]
+        logging.info(f"Rows changed: {len(changed_df)}, rows skipped as unchanged: {n_rows - len(changed_df)}")
+
+        self.fingerprints.update(zip(changed_df.description_hash, incident_at[is_changed]))
+
+        return changed_df
+
+    def save(self, cache_file: str) -> None:
+        with open(cache_file, 'w') as file:
+            file.writelines(f"{h}\t{t}\n" for h, t in self.fingerprints.items())
+
+
+def create_tmp_incident_table(txn) -> None:
     """
-    This uploads data to a temp table and then swaps it over using an upsert, to minimize any downtime with uploads
-    to a production database
+    Creates the temp table that incoming incidents are staged in before being merged into the main table
+    """
+    txn.execute(text("""
+        CREATE TEMPORARY TABLE tmp_incident (   
+        user_id             integer not null,
+        incident_at         timestamp with time zone,
+     --   severity            character varying,
+     --   custom_label        character varying,
+        description         character varying,
+        description_hash    character varying);
+    """))
+
+
+def drop_duplicate_incidents(upload_df: pd.DataFrame) -> pd.DataFrame:
     """
+    Keeps one row per (user, description hash), since the upsert can't write the same incident twice.  The earliest
+    incident_at wins, the same as when the upsert picks between copies from different batches, so which copy is kept
+    doesn't depend on how the file was split up
+    """
+    return upload_df.sort_values('incident_at', na_position='last', kind='stable') \
+        .drop_duplicates(['user_id', 'description_hash']) \
+        .sort_index()
 
-    with engine.begin() as txn:
-        txn.execute(text("""
-            CREATE TEMPORARY TABLE tmp_incident (   
-            user_id             integer not null,
-            incident_at         timestamp with time zone,
-         --   severity            character varying,
-         --   custom_label        character varying,
-            description         character varying,
-            description_hash    character varying);
-        """))
 
-        upload_df.to_sql("tmp_incident", txn, if_exists='append', index=False, chunksize=500, method='multi')
+def load_tmp_incident(txn, upload_df: pd.DataFrame, load_method: str = None) -> None:
+    """
+    Appends a batch of transformed incidents to the temp table (see `db_utils.bulk_load` for the load methods)
+    """
+    bulk_load(txn, upload_df, "tmp_incident", method=load_method)
+
 
-        r = txn.execute(text("""
-            INSERT INTO incident.incident as i 
-            (user_id, incident_at, description, description_hash)
-                SELECT t.user_id
-                , t.incident_at
-              --  , t.severity
-              --  , t.custom_label
-                , t.description
-                , t.description_hash
-                FROM tmp_incident t
-            ON CONFLICT (user_id, description_hash) 
-            DO UPDATE SET
-                incident_at = EXCLUDED.incident_at
-              --  , severity = EXCLUDED.severity
-              --  , custom_label = EXCLUDED.custom_label
-                , description = EXCLUDED.description
-            WHERE TRUE
-            -- normally i would have these in here, but since they are set outside this process, they are removed
-          -- i.severity is distinct from EXCLUDED.severity
-          --  or i.custom_label is distinct from EXCLUDED.custom_label
-            or i.incident_at is distinct from EXCLUDED.incident_at
-            or i.description is distinct from EXCLUDED.description
-    
+@dataclass
+class UploadStats:
+    rows_staged: int  # distinct incidents sent to the temp table
+    rows_inserted: int  # new incidents
+    rows_updated: int  # existing incidents that changed, and so were rewritten
+
+    @property
+    def rows_unchanged(self) -> int:
+        return self.rows_staged - self.rows_inserted - self.rows_updated
+
+
+def merge_tmp_incident(txn, profiler: StageProfiler = NULL_PROFILER) -> UploadStats:
+    """
+    Upserts everything staged in the temp table into the main table, refreshes the daily counts for the dates that
+    gained or lost incidents, then drops the temp table.  Rows that are identical to what is already stored are left
+    untouched, so they don't get rewritten (or fire the modtime trigger)
+    :return: how many of the staged rows were inserted, rewritten, or left unchanged
+    """
+    create_touched_date_table(txn)
+
+    with profiler.stage('upsert'):
+        # incidents about to move to another date take their count away from their old date...
+        txn.execute(text("""
+            INSERT INTO tmp_touched_date (user_id, date)
+            SELECT DISTINCT i.user_id, i.incident_at::date
+            FROM tmp_incident t
+            JOIN incident.incident i on i.user_id = t.user_id and i.description_hash = t.description_hash
+            WHERE i.incident_at is not null
+                and i.incident_at is distinct from t.incident_at
         """))
-        logging.info(f"Rows upserted: {r.rowcount}")
 
+        # ...and every inserted or rewritten incident counts towards its new one
+        # the same incident can still be staged more than once, from different batches (e.g. a line repeated in two
+        # shards).  one statement can't upsert a row twice, so keep the copy `drop_duplicate_incidents` would have
+        r = txn.execute(text("""
+            WITH staged AS (
+                SELECT DISTINCT ON (user_id, description_hash) *
+                FROM tmp_incident
+                ORDER BY user_id, description_hash, incident_at NULLS LAST
+            ), upserted AS (
+                INSERT INTO incident.incident as i 
+                (user_id, incident_at, description, description_hash)
+                    SELECT t.user_id
+                    , t.incident_at
+                  --  , t.severity
+                  --  , t.custom_label
+                    , t.description
+                    , t.description_hash
+                    FROM staged t
+                ON CONFLICT (user_id, description_hash) 
+                DO UPDATE SET
+                    incident_at = EXCLUDED.incident_at
+                  --  , severity = EXCLUDED.severity
+                  --  , custom_label = EXCLUDED.custom_label
+                    , description = EXCLUDED.description
+                WHERE i.incident_at IS DISTINCT FROM EXCLUDED.incident_at
+                    OR i.description IS DISTINCT FROM EXCLUDED.description
+                -- normally i would have these in here, but since they are set outside this process, they are removed
+              --  or i.severity is distinct from EXCLUDED.severity
+              --  or i.custom_label is distinct from EXCLUDED.custom_label
+                -- xmax is only 0 for a freshly inserted row version
+                RETURNING (i.xmax = 0) as is_insert, i.user_id, i.incident_at::date as date
+            ), touched AS (
+                INSERT INTO tmp_touched_date (user_id, date)
+                SELECT DISTINCT user_id, date FROM upserted WHERE date is not null
+            )
+            SELECT (SELECT count(*) FROM staged) as rows_staged
+            , count(*) FILTER (WHERE is_insert) as rows_inserted
+            , count(*) FILTER (WHERE NOT is_insert) as rows_updated
+            FROM upserted
+        """)).one()
+    stats = UploadStats(r.rows_staged, r.rows_inserted, r.rows_updated)
+    logging.info(f"Rows inserted: {stats.rows_inserted}, rows rewritten: {stats.rows_updated}, "
+                 f"rows unchanged: {stats.rows_unchanged}")
+
+    with profiler.stage('daily_counts'):
+        refresh_daily_counts(txn)
+
+    with profiler.stage('cleanup'):
         txn.execute(text("""DROP TABLE IF EXISTS tmp_incident;"""))
 
-    return
+    return stats
+
+
+def upload_data(upload_df: pd.DataFrame, load_method: str = None,
+                profiler: StageProfiler = NULL_PROFILER) -> UploadStats:
+    """
+    This uploads data to a temp table and then swaps it over using an upsert, to minimize any downtime with uploads
+    to a production database
+    """
+    return upload_batches([upload_df], load_method, profiler)
+
+
+def upload_batches(upload_dfs: Iterable[pd.DataFrame], load_method: str = None,
+                   profiler: StageProfiler = NULL_PROFILER) -> UploadStats:
+    """
+    Same as `upload_data`, but for data that arrives in batches (e.g., when streaming a large file).  Each batch is
+    appended to the temp table as soon as it is produced, so only one batch needs to be held in memory at a time.
+    The upsert itself runs once, after the last batch, inside the same transaction, so the end result is identical
+    to uploading everything at once.
+    """
+    with get_engine().begin() as txn:
+        create_tmp_incident_table(txn)
+        n_rows = 0
+        for upload_df in upload_dfs:
+            with profiler.stage('tmp_load', len(upload_df)):
+                upload_df = drop_duplicate_incidents(upload_df)
+                load_tmp_incident(txn, upload_df, load_method)
+            n_rows += len(upload_df)
+            logging.info(f"Rows staged: {n_rows}")
+        stats = merge_tmp_incident(txn, profiler)
+
+    # in its own transaction, after the upload has committed, so the log isn't locked while the upload runs
+    with get_engine().begin() as txn:
+        prune_data_changes(txn)
+
+    return stats
+
+
+def prune_data_changes(txn) -> None:
+    """
+    Folds the rows of incident.data_change into a single row with their total n_statements.  The dashboard cache's
+    data version is that total, so it doesn't change, but the log stays small instead of growing with every write
+    """
+    # one statement, so readers see either all of the old rows or the one that replaces them.  rows committed after
+    # it started aren't touched, and are still counted as they were
+    txn.execute(text("""
+        WITH pruned AS (
+            DELETE FROM incident.data_change
+            RETURNING n_statements
+        )
+        INSERT INTO incident.data_change (table_name, operation, n_statements)
+        SELECT 'data_change', 'PRUNE', sum(n_statements)
+        FROM pruned
+        HAVING count(*) > 0
+    """))
+
+
+# marks the end of the batches on the upload queue
+_END_OF_BATCHES = object()
+
+
+class PipelineAborted(Exception):
+    pass
+
+
+def upload_batches_pipelined(upload_dfs: Iterable[pd.DataFrame], load_method: str = None, queue_size: int = 4,
+                             profiler: StageProfiler = NULL_PROFILER) -> UploadStats:
+    """
+    Same as `upload_batches`, but the upload runs in its own thread, fed through a bounded queue.  That way the
+    db loads the temp table while the next batches are still being parsed, instead of each side waiting on the other.
+    The queue size caps how many parsed batches can be waiting in memory.  Everything is still one transaction, with
+    one upsert at the end; if either side fails, nothing is committed.
+    """
+    batch_queue = queue.Queue(maxsize=queue_size)
+    result = {}
+
+    def iter_queue() -> Iterator[pd.DataFrame]:
+        while True:
+            upload_df = batch_queue.get()
+            if upload_df is _END_OF_BATCHES:
+                return
+            if isinstance(upload_df, PipelineAborted):
+                # raising inside the transaction rolls it back
+                raise upload_df
+            yield upload_df
+
+    def upload() -> None:
+        try:
+            result['stats'] = upload_batches(iter_queue(), load_method, profiler)
+        except BaseException as e:
+            result['error'] = e
+
+    uploader = threading.Thread(target=upload, name='uploader', daemon=True)
+    uploader.start()
+
+    def put(item) -> None:
+        # don't block forever on a full queue if the uploader has died
+        while uploader.is_alive():
+            try:
+                batch_queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    try:
+        for upload_df in upload_dfs:
+            put(upload_df)
+            if not uploader.is_alive():
+                break
+    except BaseException:
+        put(PipelineAborted("Parsing failed, upload rolled back"))
+        uploader.join()
+        raise
+
+    put(_END_OF_BATCHES)
+    uploader.join()
+
+    if 'error' in result:
+        raise result['error']
+
+    return result['stats']
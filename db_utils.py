@@ -1,11 +1,341 @@
+import io
 import os
+import threading
+import time
+from dataclasses import dataclass, asdict
 
-from sqlalchemy import create_engine
+from typing import Dict, List, Optional, Tuple, Union
 
+import pandas as pd
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.elements import TextClause
 
-def get_engine():
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+except ImportError:
+    pa = pa_csv = None
+
+# how data frames get bulk loaded into tables: postgres COPY (fast), or pandas' to_sql with multi-row INSERTs (the
+# original way, kept as a fallback)
+LOAD_METHODS = ['copy', 'to_sql']
+DEFAULT_LOAD_METHOD = os.environ.get("THRIVE_LOAD_METHOD", "copy")
+
+# rows per COPY statement, so the text buffer for any one statement stays a reasonable size
+COPY_CHUNKSIZE = 100_000
+
+# how query results get fetched into data frames: postgres `COPY (query) TO STDOUT` as CSV, parsed straight into
+# arrow by pyarrow (fast), or pd.read_sql, row by row through python tuples (the original way, kept as a fallback)
+FETCH_METHODS = ['copy', 'read_sql']
+DEFAULT_FETCH_METHOD = os.environ.get("THRIVE_FETCH_METHOD", "copy")
+
+# postgres type oid -> arrow type the CSV column is parsed as.  timestamptz is parsed by pandas afterwards, since
+# postgres' short `+00` offsets aren't something arrow's parser takes.  results with any other type (e.g. arrays) are
+# fetched with read_sql instead
+COPY_ARROW_TYPES = {
+    16: 'bool',
+    20: 'int64', 21: 'int64', 23: 'int64',
+    700: 'float64', 701: 'float64', 1700: 'float64',
+    19: 'string', 25: 'string', 1042: 'string', 1043: 'string', 2950: 'string',
+    1082: 'date32',
+    1114: 'timestamp',
+    1184: 'timestamptz',
+}
+
+# how many statements' result columns to remember (see `get_result_columns`); the dashboard only has so many
+RESULT_COLUMNS_CACHE_SIZE = 1024
+
+# connection pool settings; the defaults suit one streamlit server or one ingestion run against a local postgres
+POOL_SIZE = int(os.environ.get("THRIVE_POOL_SIZE", 5))
+POOL_MAX_OVERFLOW = int(os.environ.get("THRIVE_POOL_MAX_OVERFLOW", 10))
+POOL_PRE_PING = os.environ.get("THRIVE_POOL_PRE_PING", "true").lower() in ('1', 'true', 'yes')
+POOL_RECYCLE_SECONDS = int(os.environ.get("THRIVE_POOL_RECYCLE_SECONDS", 1800))
+# 0 leaves postgres' own statement_timeout alone
+STATEMENT_TIMEOUT_MS = int(os.environ.get("THRIVE_STATEMENT_TIMEOUT_MS", 0))
+
+
+@dataclass
+class PoolStats:
+    connects: int = 0
+    checkouts: int = 0
+    checkins: int = 0
+    wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool that keeps track of how long callers wait to get a connection out of it
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+        self._stats_lock = threading.Lock()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.stats.wait_seconds += waited
+                self.stats.max_wait_seconds = max(self.stats.max_wait_seconds, waited)
+
+
+# one engine per process: a forked child (e.g. a parsing worker) must not reuse its parent's pooled sockets
+_engine = None
+_engine_pid = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> Engine:
+    """
+    Returns this process' engine, creating it on first use
+    """
+    global _engine, _engine_pid
+    if _engine is not None and _engine_pid == os.getpid():
+        return _engine
+
+    with _engine_lock:
+        if _engine is None or _engine_pid != os.getpid():
+            _engine = create_pooled_engine()
+            _engine_pid = os.getpid()
+
+    return _engine
+
+
+def create_pooled_engine() -> Engine:
     db_url = os.environ.get("LOCAL_DB_URL")
     if db_url is None:
         raise ValueError("Cannot get url! ")
 
-    return create_engine(db_url)
+    connect_args = {}
+    if STATEMENT_TIMEOUT_MS:
+        connect_args['options'] = f"-c statement_timeout={STATEMENT_TIMEOUT_MS}"
+
+    engine = create_engine(
+        db_url,
+        poolclass=TimedQueuePool,
+        pool_size=POOL_SIZE,
+        max_overflow=POOL_MAX_OVERFLOW,
+        pool_pre_ping=POOL_PRE_PING,
+        pool_recycle=POOL_RECYCLE_SECONDS,
+        connect_args=connect_args,
+    )
+
+    @event.listens_for(engine, 'connect')
+    def count_connect(dbapi_connection, connection_record):
+        engine.pool.stats.connects += 1
+
+    @event.listens_for(engine, 'checkout')
+    def count_checkout(dbapi_connection, connection_record, connection_proxy):
+        engine.pool.stats.checkouts += 1
+
+    @event.listens_for(engine, 'checkin')
+    def count_checkin(dbapi_connection, connection_record):
+        engine.pool.stats.checkins += 1
+
+    return engine
+
+
+def get_pool_stats() -> dict:
+    """
+    Connection pool statistics for this process' engine, or an empty dict if it hasn't been created yet
+    """
+    if _engine is None or _engine_pid != os.getpid():
+        return {}
+
+    pool = _engine.pool
+    return {
+        **asdict(pool.stats),
+        'pool_size': pool.size(),
+        'checked_out': pool.checkedout(),
+        'overflow': pool.overflow(),
+    }
+
+
+def dispose_engine() -> None:
+    """
+    Closes this process' pooled connections and forgets the engine, so the next get_engine() starts fresh
+    """
+    global _engine, _engine_pid
+    with _engine_lock:
+        if _engine is not None and _engine_pid == os.getpid():
+            _engine.dispose()
+        _engine = None
+        _engine_pid = None
+
+
+def bulk_load(txn, df: pd.DataFrame, table_name: str, method: str = None) -> None:
+    """
+    Appends a data frame to an existing table, within the given transaction
+    :param txn: open connection/transaction
+    :param df: data to load; column names must match the table's
+    :param table_name: table to load into
+    :param method: one of LOAD_METHODS; defaults to DEFAULT_LOAD_METHOD
+    """
+    method = method or DEFAULT_LOAD_METHOD
+    if method == 'copy':
+        copy_dataframe(txn, df, table_name)
+    elif method == 'to_sql':
+        df.to_sql(table_name, txn, if_exists='append', index=False, chunksize=500, method='multi')
+    else:
+        raise ValueError(f"Unknown load method {method}, must be one of {LOAD_METHODS}")
+
+
+def copy_dataframe(txn, df: pd.DataFrame, table_name: str) -> None:
+    """
+    Loads a data frame with `COPY ... FROM STDIN`, streamed from an in-memory text buffer through the psycopg2
+    connection underneath the transaction
+    """
+    columns = ', '.join(f'"{column}"' for column in df.columns)
+    cursor = txn.connection.cursor()
+    try:
+        for start in range(0, len(df), COPY_CHUNKSIZE):
+            buffer = io.StringIO(to_copy_text(df.iloc[start:start + COPY_CHUNKSIZE]))
+            cursor.copy_expert(f"COPY {table_name} ({columns}) FROM STDIN", buffer)
+    finally:
+        cursor.close()
+
+
+def to_copy_text(df: pd.DataFrame) -> str:
+    """
+    Serializes a data frame into postgres' COPY text format: tab separated, `\\N` for nulls, and backslashes, tabs,
+    and newlines within values escaped
+    """
+    if df.empty:
+        return ''
+
+    columns = []
+    for _, column in df.items():
+        if pd.api.types.is_datetime64_any_dtype(column):
+            values = column.dt.strftime('%Y-%m-%d %H:%M:%S.%f%z')
+        elif pd.api.types.is_bool_dtype(column):
+            values = column.map({True: 't', False: 'f'})
+        else:
+            values = column.astype(str)
+            # any text, whatever its dtype (object, string, string[pyarrow], category...)
+            if not pd.api.types.is_numeric_dtype(column):
+                values = values.str.replace('\\', '\\\\', regex=False) \
+                    .str.replace('\t', '\\t', regex=False) \
+                    .str.replace('\n', '\\n', regex=False) \
+                    .str.replace('\r', '\\r', regex=False)
+
+        columns.append(values.where(column.notna(), '\\N'))
+
+    lines = columns[0].str.cat(columns[1:], sep='\t') if len(columns) > 1 else columns[0]
+    return '\n'.join(lines) + '\n'
+
+
+def fetch_dataframe(engine, query: Union[str, TextClause], params: Optional[Dict] = None,
+                    method: str = None) -> pd.DataFrame:
+    """
+    Runs a query and returns its result as a data frame; a drop-in for `pd.read_sql(query, engine, params=params)`
+    :param engine: engine (or connection) to run the query on
+    :param query: SQL, with `:name` bind parameters
+    :param params: bind parameter values
+    :param method: one of FETCH_METHODS; defaults to DEFAULT_FETCH_METHOD.  'copy' falls back to 'read_sql' if
+    pyarrow isn't installed or the result has a column type COPY_ARROW_TYPES doesn't cover.  Queries known to return
+    such types (e.g. arrays) should ask for 'read_sql' directly
+    :return: the result; with 'copy', text columns come back as arrow backed strings
+    """
+    method = method or DEFAULT_FETCH_METHOD
+    if method not in FETCH_METHODS:
+        raise ValueError(f"Unknown fetch method {method}, must be one of {FETCH_METHODS}")
+
+    if isinstance(query, str):
+        query = text(query)
+
+    if method == 'copy' and pa_csv is not None:
+        with engine.connect() as conn:
+            df = copy_query_to_dataframe(conn, query, params or {})
+        if df is not None:
+            return df
+
+    return pd.read_sql(query, engine, params=params)
+
+
+# statement (with its bind parameters still as placeholders) -> its result's (name, type oid) columns
+_result_columns: Dict[str, List[Tuple[str, int]]] = {}
+_result_columns_lock = threading.Lock()
+
+
+def get_result_columns(cursor, statement: str, sql: str) -> List[Tuple[str, int]]:
+    """
+    The names and types of a statement's result columns, which COPY's CSV doesn't say.  They're looked up from the
+    statement's (unexecuted) result description the first time it is run, and remembered from then on, since they
+    don't depend on the parameter values
+    :param cursor: psycopg2 cursor to look them up with
+    :param statement: the statement, as the cache key
+    :param sql: the statement with its parameters inlined, to run
+    """
+    columns = _result_columns.get(statement)
+    if columns is None:
+        cursor.execute(f"SELECT * FROM ({sql}) q LIMIT 0")
+        columns = [(column.name, column.type_code) for column in cursor.description]
+        with _result_columns_lock:
+            if len(_result_columns) >= RESULT_COLUMNS_CACHE_SIZE:
+                _result_columns.clear()
+            _result_columns[statement] = columns
+
+    return columns
+
+
+def copy_query_to_dataframe(conn, query: TextClause, params: Dict) -> Optional[pd.DataFrame]:
+    """
+    Streams a query's result out with `COPY (query) TO STDOUT` as CSV, through the psycopg2 connection underneath
+    the given one, and parses it with pyarrow
+    :return: the result, or None if it has columns whose types can't be parsed from CSV (which is known without
+    running it, once the statement has been seen)
+    """
+    compiled = query.compile(dialect=conn.dialect)
+    statement = str(compiled)
+    cursor = conn.connection.cursor()
+    try:
+        # COPY can't take bind parameters, so have psycopg2 inline them (with its usual quoting)
+        sql = cursor.mogrify(statement, compiled.construct_params(params)).decode()
+
+        columns = get_result_columns(cursor, statement, sql)
+        if any(type_code not in COPY_ARROW_TYPES for _, type_code in columns):
+            return None
+
+        buffer = io.BytesIO()
+        cursor.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER true)", buffer)
+    finally:
+        cursor.close()
+
+    buffer.seek(0)
+    return read_copy_csv(buffer, [(name, COPY_ARROW_TYPES[type_code]) for name, type_code in columns])
+
+
+def read_copy_csv(buffer: io.BytesIO, columns: List[Tuple[str, str]]) -> pd.DataFrame:
+    """
+    Parses the output of `COPY ... TO STDOUT WITH (FORMAT csv, HEADER true)` into a data frame
+    :param buffer: the CSV
+    :param columns: each column's name and type (one of the COPY_ARROW_TYPES values), in order
+    """
+    arrow_types = {
+        'bool': pa.bool_(), 'int64': pa.int64(), 'float64': pa.float64(), 'string': pa.string(),
+        'date32': pa.date32(), 'timestamp': pa.timestamp('us'), 'timestamptz': pa.string(),
+    }
+    table = pa_csv.read_csv(buffer, convert_options=pa_csv.ConvertOptions(
+        column_types={name: arrow_types[column_type] for name, column_type in columns},
+        true_values=['t'], false_values=['f'],
+        # postgres writes nulls unquoted and empty strings quoted, so only the former are null
+        strings_can_be_null=True, quoted_strings_can_be_null=False,
+    ))
+    df = table.to_pandas(types_mapper={pa.string(): pd.StringDtype('pyarrow')}.get)
+
+    for name, column_type in columns:
+        if column_type == 'timestamptz':
+            df[name] = pd.to_datetime(df[name].astype(object), format='ISO8601', utc=True)
+
+    return df
@@ -0,0 +1,137 @@
+import functools
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Tuple
+
+import pandas as pd
+import streamlit as st
+from sqlalchemy import text
+
+"""
+Shared cache for the dashboard's data loaders.
+
+Every widget interaction reruns a page from the top, so without this each date picker change re-runs the full
+incident/category join.  Cached frames are kept until the data underneath them changes, which is detected with
+incident.data_change: triggers on the incident, incident_category, category and daily_counts tables add a row to it
+for every statement that changes them, so the sum of its n_statements goes up with every commit that writes anything
+the dashboard reads, however long that transaction ran.  Ingestion prunes the log by folding old rows into one, which
+leaves the sum as it was.
+Entries are evicted least recently used first once the cache goes over its memory cap.
+"""
+
+CACHE_MAX_BYTES = int(os.environ.get("THRIVE_CACHE_MAX_MB", 512)) * 1024 ** 2
+# how long a checked data version is trusted for, so one page run with several loaders only checks once
+VERSION_CHECK_SECONDS = float(os.environ.get("THRIVE_CACHE_VERSION_CHECK_SECONDS", 1))
+
+
+def get_data_version(engine) -> Tuple:
+    with engine.connect() as conn:
+        return tuple(conn.execute(text("""
+            SELECT coalesce(sum(n_statements), 0) FROM incident.data_change
+        """)).one())
+
+
+class QueryCache:
+    """
+    LRU cache of loader results, all tagged with the data version they were loaded at
+    """
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES, version_check_seconds: float = VERSION_CHECK_SECONDS):
+        self.max_bytes = max_bytes
+        self.version_check_seconds = version_check_seconds
+        self.entries = OrderedDict()
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._version = None
+        self._version_checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def current_version(self, engine) -> Tuple:
+        now = time.monotonic()
+        if self._version is None or now - self._version_checked_at >= self.version_check_seconds:
+            version = get_data_version(engine)
+            with self._lock:
+                if version != self._version:
+                    # everything cached was loaded at an older version
+                    self._clear()
+                self._version, self._version_checked_at = version, now
+
+        return self._version
+
+    def get(self, key: Hashable, version: Tuple):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, version: Tuple, df: pd.DataFrame) -> None:
+        n_bytes = int(df.memory_usage(deep=True).sum())
+        if n_bytes > self.max_bytes:
+            logging.warning(f"Not caching {key[0]}: {n_bytes} bytes is over the cache's {self.max_bytes} byte cap")
+            return
+
+        with self._lock:
+            if key in self.entries:
+                self.n_bytes -= self.entries.pop(key)[2]
+            self.entries[key] = (version, df, n_bytes)
+            self.n_bytes += n_bytes
+
+            while self.n_bytes > self.max_bytes:
+                _, (_, _, evicted_bytes) = self.entries.popitem(last=False)
+                self.n_bytes -= evicted_bytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear()
+
+    def _clear(self) -> None:
+        self.entries.clear()
+        self.n_bytes = 0
+
+    def stats(self) -> dict:
+        return {'entries': len(self.entries), 'bytes': self.n_bytes, 'max_bytes': self.max_bytes,
+                'hits': self.hits, 'misses': self.misses}
+
+
+@st.cache_resource
+def get_query_cache() -> QueryCache:
+    # one cache for the whole server, shared across sessions and reruns
+    return QueryCache()
+
+
+def current_data_version(engine) -> Tuple:
+    """
+    The data version the cached loaders are currently serving, for keying other caches (e.g. rendered charts) on
+    """
+    return get_query_cache().current_version(engine)
+
+
+def cached_loader(loader: Callable) -> Callable:
+    """
+    Caches a loader of the form `loader(engine, *args, **kwargs) -> pd.DataFrame` on its arguments (other than the
+    engine) and the current data version.  Arguments must be hashable.  The undecorated loader is still available as
+    `.__wrapped__`
+    """
+    @functools.wraps(loader)
+    def wrapper(engine, *args, **kwargs):
+        cache = get_query_cache()
+        key = (loader.__qualname__, args, tuple(sorted(kwargs.items())))
+        version = cache.current_version(engine)
+
+        df = cache.get(key, version)
+        if df is None:
+            df = loader(engine, *args, **kwargs)
+            cache.put(key, version, df)
+
+        # pages add and overwrite columns, so never hand out the cached frame itself
+        return df.copy()
+
+    return wrapper
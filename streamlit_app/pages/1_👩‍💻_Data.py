@@ -1,34 +1,85 @@
-import pandas as pd
+import os
+
 import streamlit as st
 
 from db_utils import get_engine
-from streamlit_app.utilities import get_category_level_data
+from streamlit_app.utilities import get_incident_page, get_incident_count, search_incidents, count_search_matches, \
+    get_subcategory_options, get_label_options, select_generic_label, load_concurrently, SEARCH_COUNT_LIMIT
 
 engine = get_engine()
 
+# rows per page to choose from; the first is the default
+PAGE_SIZES = [int(_) for _ in os.environ.get("THRIVE_DATA_PAGE_SIZES", "50,100,250,1000").split(',')]
+
 st.set_page_config(page_title="Trends", layout='wide')
 st.write("# The Base Data")
 
-df = get_category_level_data(engine)
-
-category_df = pd.read_sql("""
-    SELECT subcategory 
-    FROM incident.category
-    
-    UNION 
-    
-    SELECT distinct subcategory
-    FROM incident.incident_category
-""", engine)
+options = load_concurrently(engine, subcategories=(get_subcategory_options, {}),
+                            custom_labels=(get_label_options, {'label': 'custom_label'}))
 
-subcategories = list(category_df.sort_values(by='subcategory').subcategory)
+subcategories = list(options['subcategories'].sort_values(by='subcategory').subcategory)
 
 st.write("## Categories")
 subcategories_to_display = st.multiselect("OPTIONAL: Include only the following subcategories", subcategories)
 
-if len(subcategories_to_display) > 0:
-    show_df = df[df.subcategories.apply(lambda x: any([_ in x for _ in subcategories_to_display]))]
+severity = select_generic_label('severity', ['High', 'Medium', 'Low'])
+custom_labels = sorted({_.capitalize() for _ in options['custom_labels'].label})
+custom_label = select_generic_label('custom_label', custom_labels)
+
+search = st.text_input("Search descriptions (words, \"exact phrases\", -excluded words):").strip()
+
+# search results are always best match first
+sort_order = st.radio("Sort:", ['Newest first', 'Oldest first'], horizontal=True, disabled=bool(search))
+page_size = st.selectbox("Incidents per page:", PAGE_SIZES)
+
+# the loader keeps incidents with any of the chosen subcategories (or all incidents, if none are chosen)
+filters = {'severity': severity, 'custom_label': custom_label,
+           'subcategories': tuple(sorted(subcategories_to_display))}
+
+# each page is fetched from the cursor (last row) of the page before it, so keep the cursors of the pages so far to
+# be able to go back.  any change in what's shown starts again from the first page
+page_key = (tuple(filters.items()), search, sort_order, page_size)
+if st.session_state.get('data_page_key') != page_key:
+    st.session_state['data_page_key'] = page_key
+    st.session_state['data_page_cursors'] = [None]
+
+columns = ('date', 'severity', 'custom_label', 'description', 'category', 'subcategories')
+cursors = st.session_state['data_page_cursors']
+first_row = (len(cursors) - 1) * page_size
+
+# a common search word can match most incidents, so matches are only counted up to SEARCH_COUNT_LIMIT
+more_than_counted = False
+if search:
+    # ranked results are paged by position, so their "cursors" are only there to count pages
+    results = load_concurrently(
+        engine,
+        page=(search_incidents, {'search': search, 'offset': first_row, 'page_size': page_size, 'columns': columns,
+                                 **filters}),
+        count=(count_search_matches, {'search': search, **filters}))
+    page_df = results['page']
+    n_incidents = int(results['count'].n.iloc[0])
+    more_than_counted = n_incidents > SEARCH_COUNT_LIMIT
 else:
-    show_df = df
+    results = load_concurrently(
+        engine,
+        page=(get_incident_page, {'after': cursors[-1], 'page_size': page_size,
+                                  'newest_first': sort_order == 'Newest first', 'columns': columns, **filters}),
+        count=(get_incident_count, filters))
+    page_df = results['page']
+    n_incidents = int(results['count'].n.iloc[0])
+
+total = f"{SEARCH_COUNT_LIMIT}+" if more_than_counted else n_incidents
+st.write(f"Showing incidents {first_row + 1 if len(page_df) else first_row}-{first_row + len(page_df)} of {total}")
+is_last_page = len(page_df) < page_size or (not more_than_counted and first_row + len(page_df) >= n_incidents)
+
+previous_column, next_column = st.columns(2)
+if previous_column.button("Previous page", disabled=len(cursors) == 1):
+    cursors.pop()
+    st.rerun()
+if next_column.button("Next page", disabled=is_last_page):
+    last_row = page_df.iloc[-1]
+    cursors.append(None if search else (last_row.cursor_at, str(last_row.cursor_id)))
+    st.rerun()
 
-st.dataframe(show_df.drop(columns='incident_id'), hide_index=True)
+st.dataframe(page_df.drop(columns=['cursor_at', 'cursor_id', 'rank'], errors='ignore'), hide_index=True,
+             column_config={'date': st.column_config.DateColumn()})
@@ -1,32 +1,33 @@
-import pandas as pd
 import streamlit as st
 from db_utils import get_engine
 from lets_plot import *
-from streamlit_app.utilities import get_category_level_data, set_date_range, filter_data_by_date_range, \
-    filter_by_generic_label
+from streamlit_app.utilities import get_daily_counts, get_label_options, get_date_bounds, set_date_range, \
+    select_generic_label, build_time_series, load_concurrently
 from streamlit_letsplot import st_letsplot
 
 LetsPlot.setup_html()
 st.set_page_config(page_title="Trends", layout='wide')
 engine = get_engine()
 
-df = get_category_level_data(engine)
-
 st.write("# Trend Examples")
+# fetch what the filters need together
+options = load_concurrently(engine, date_bounds=(get_date_bounds, {}),
+                            custom_labels=(get_label_options, {'label': 'custom_label'}))
+
 # get date range
-start_date, end_date = set_date_range(df)
+start_date, end_date = set_date_range(engine, options['date_bounds'])
 
 # get custom label info
-custom_labels = [_.capitalize() for _ in df.custom_label.unique() if _ is not None]
-filtered_df = filter_by_generic_label('custom_label', custom_labels, df)
+custom_labels = sorted({_.capitalize() for _ in options['custom_labels'].label})
+custom_label = select_generic_label('custom_label', custom_labels)
 
-# filter by date
-filtered_df = filter_data_by_date_range(filtered_df, start_date, end_date)
+# one row per date/category/label/severity with its number of incidents, rather than one row per incident
+filtered_df = get_daily_counts(engine, start_date=start_date, end_date=end_date, custom_label=custom_label)
 
 st.write("## Histogram")
 include_categories = st.checkbox("Include categories")
 
-g = ggplot(filtered_df, aes(x='date')) + theme_light() + \
+g = ggplot(filtered_df, aes(x='date', weight='n')) + theme_light() + \
     labs(x="Date", y="Frequency of Incidents", title="Timeline of Incidents") + ggsize(800, 400)
 
 if include_categories:
@@ -39,20 +40,15 @@ st_letsplot(g)
 
 st.write("## Trend Line")
 
-agg_df = filtered_df.groupby(['date', 'custom_label'], as_index=False)['incident_id'] \
-    .count().rename(columns={'incident_id': 'n'})
+buckets = {'Day': 'D', 'Week': 'W', 'Month': 'M'}
+bucket = st.radio("Count incidents per:", list(buckets), horizontal=True)
+rolling_window = st.number_input("Smooth over this many periods (1 for no smoothing):", min_value=1, value=1)
 
-date_df = pd.DataFrame({'date': pd.date_range(start=filtered_df.date.min(), end=filtered_df.date.max())})
-n_labels = filtered_df.custom_label.nunique()
-plot_df = pd.DataFrame()
-for label in filtered_df.custom_label.unique():
-    date_df['custom_label'] = label
-    temp = pd.merge(date_df, agg_df, on=['date', 'custom_label'], how='left')
-    temp['n'] = temp['n'].fillna(0)
-    plot_df = pd.concat([plot_df, temp])
+plot_df = build_time_series(filtered_df, ['custom_label'], freq=buckets[bucket], rolling_window=rolling_window,
+                            start_date=start_date, end_date=end_date)
 
 g = ggplot(plot_df, aes(x='date', y='n')) + geom_point(aes(col='custom_label')) + \
-    geom_line(aes(col='custom_label')) + \
+    geom_line(aes(y='n_rolling', col='custom_label')) + \
     theme_light() + ggsize(800, 400) + \
     labs(x="Date", y="Frequency of Incidents", title="Timeline of Incidents By Label")
 g.show()
@@ -1,9 +1,10 @@
-from typing import Dict
+import datetime
+from typing import Dict, Tuple
 
 import pandas as pd
 import streamlit as st
 from db_utils import get_engine
-from streamlit_app.utilities import get_subcategory_level_data, set_date_range, filter_by_generic_label, filter_data_by_date_range
+from streamlit_app.utilities import get_calendar_events, select_generic_label
 from streamlit_calendar import calendar
 
 st.set_page_config(page_title="Calendar View", layout='wide')
@@ -22,6 +23,10 @@ calendar_options = {
 
 }
 
+# events are only loaded for what the calendar shows, plus this many days either side, so paging a month or so
+# doesn't need another query
+PREFETCH_DAYS = 45
+
 custom_css = """
     .fc-event-past {
         opacity: 0.8;
@@ -41,8 +46,8 @@ custom_css = """
 def form_event(row: pd.Series) -> Dict[str, str]:
     return {
         "title": row.description.split('.')[0],
-        "start": str(row.date),
-        "end": str(row.date),
+        "start": row.date.strftime('%Y-%m-%d'),
+        "end": row.date.strftime('%Y-%m-%d'),
         "backgroundColor": severity_colors.get(row.severity, 'black'),
         "severity": row.severity,
         "category": row.category,
@@ -51,22 +56,52 @@ def form_event(row: pd.Series) -> Dict[str, str]:
     }
 
 
+def get_loaded_window(visible_start: datetime.date,
+                      visible_end: datetime.date) -> Tuple[datetime.date, datetime.date]:
+    margin = datetime.timedelta(days=PREFETCH_DAYS)
+    return visible_start - margin, visible_end + margin
+
+
+def parse_calendar_date(value: str) -> datetime.date:
+    # the calendar reports ISO timestamps, possibly with a time zone; only the date part matters here
+    return datetime.date.fromisoformat(value[:10])
+
+
 st.write("# Calendar View")
 
 engine = get_engine()
-df = get_subcategory_level_data(engine)
-agg_df = df.groupby(['incident_id', 'date', 'severity', 'custom_label', 'description',
-                     'category'], as_index=False).agg({'subcategory': lambda x: ', '.join(x)})
 
 # get custom label info
-filtered_df = filter_by_generic_label('severity', ['High', 'Medium', 'Low'], agg_df)
+severity = select_generic_label('severity', ['High', 'Medium', 'Low'])
+
+# the calendar opens on the current month (a month view shows at most six weeks)
+if 'calendar_window' not in st.session_state:
+    month_start = datetime.date.today().replace(day=1)
+    st.session_state['calendar_window'] = get_loaded_window(month_start, month_start + datetime.timedelta(days=42))
+    st.session_state['calendar_initial_date'] = month_start.isoformat()
+
+window_start, window_end = st.session_state['calendar_window']
+filtered_df = get_calendar_events(engine, start_date=window_start, end_date=window_end, severity=severity)
 
 calendar_events = [form_event(row) for row in filtered_df.itertuples()]
 
 displayed_calendar = calendar(
     events=calendar_events,
-    options=calendar_options,
+    # reopen on the month that was being looked at, since new events re-render the calendar
+    options={**calendar_options, "initialDate": st.session_state['calendar_initial_date']},
+    callbacks=['datesSet'],
     # custom_css=custom_css,
     # key='calendar',  # Assign a widget key to prevent state loss [this seems to be messing with the filtering, so removing for now]
 )
 st.write(displayed_calendar)
+
+# when the calendar is paged outside of what's loaded, move the window and load again
+if displayed_calendar and displayed_calendar.get('callback') == 'datesSet':
+    dates_set = displayed_calendar['datesSet']
+    visible_start, visible_end = parse_calendar_date(dates_set['start']), parse_calendar_date(dates_set['end'])
+    st.session_state['calendar_initial_date'] = \
+        dates_set.get('view', {}).get('currentStart', dates_set['start'])[:10]
+
+    if visible_start < window_start or visible_end > window_end:
+        st.session_state['calendar_window'] = get_loaded_window(visible_start, visible_end)
+        st.rerun()
@@ -1,30 +1,24 @@
+import datetime
+from typing import Optional
+
+import plotly.graph_objects as go
 import plotly.io as pio
 import streamlit as st
 from db_utils import get_engine
 from plotly_calplot import calplot
-from streamlit_app.utilities import get_category_level_data, set_date_range, filter_by_generic_label, \
-    filter_data_by_date_range
+from streamlit_app.cache import current_data_version
+from streamlit_app.utilities import get_daily_counts, set_date_range, select_generic_label, build_time_series
 
 st.set_page_config(page_title="Calendar Heatmap View", layout='wide')
 
-st.write("# Calendar Heatmap View")
-
-engine = get_engine()
-df = get_category_level_data(engine)
-start_date, end_date = set_date_range(df)
-
-# get custom label info
-filtered_df = filter_by_generic_label('severity', ['High', 'Medium', 'Low'], df)
-
-# filter by date
-filtered_df = filter_data_by_date_range(filtered_df, start_date, end_date)
 
-if filtered_df.empty:
-    st.write("No data to display")
-else:
+def get_heatmap_figure(engine, start_date: datetime.date, end_date: datetime.date,
+                       severity: Optional[str]) -> Optional[go.Figure]:
+    filtered_df = get_daily_counts(engine, start_date=start_date, end_date=end_date, severity=severity)
+    if filtered_df.empty:
+        return None
 
-    agg_df = filtered_df.groupby('date', as_index=False)['incident_id'] \
-        .count().rename(columns={'incident_id': 'n'})
+    agg_df = build_time_series(filtered_df)
 
     fig = calplot(
         agg_df,
@@ -35,15 +29,48 @@ else:
         showscale=True,  # Show color bar
         dark_theme=True
     )
-    # fig.show()
 
     # fig.update_layout(height = 500,
     #                   width = 1500,
     #                   font=dict(size = 16),
     #                   margin = {'t':0, 'b':0, 'l':40})
 
-    # fig.show()
-    # plt.savefig(f'plots/heatmap.pdf', bbox_inches='tight')
-    pio.write_image(fig, 'plots/calplot.png', engine='kaleido')
+    return fig
+
+
+# kaleido export is by far the slowest part of this page, so each rendering is kept (in memory, not in a shared file
+# that concurrent sessions would overwrite) until the filters or the data change.  data_version is only there for the
+# cache key
+@st.cache_data(max_entries=64, show_spinner=False)
+def render_heatmap_png(_engine, start_date: datetime.date, end_date: datetime.date, severity: Optional[str],
+                       data_version: tuple) -> Optional[bytes]:
+    fig = get_heatmap_figure(_engine, start_date, end_date, severity)
+    if fig is None:
+        return None
 
-    st.image("plots/calplot.png", caption="")
+    return pio.to_image(fig, format='png', engine='kaleido')
+
+
+st.write("# Calendar Heatmap View")
+
+engine = get_engine()
+start_date, end_date = set_date_range(engine)
+
+# get custom label info
+severity = select_generic_label('severity', ['High', 'Medium', 'Low'])
+
+# the interactive version is drawn by the browser, so skips kaleido altogether
+interactive = st.checkbox("Interactive heatmap")
+
+if interactive:
+    fig = get_heatmap_figure(engine, start_date, end_date, severity)
+    if fig is None:
+        st.write("No data to display")
+    else:
+        st.plotly_chart(fig)
+else:
+    png = render_heatmap_png(engine, start_date, end_date, severity, current_data_version(engine))
+    if png is None:
+        st.write("No data to display")
+    else:
+        st.image(png, caption="")
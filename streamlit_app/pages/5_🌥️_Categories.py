@@ -6,7 +6,7 @@ import plotly.graph_objects as go
 import streamlit as st
 from db_utils import get_engine
 from lets_plot import *
-from streamlit_app.utilities import set_date_range, filter_data_by_date_range
+from streamlit_app.utilities import get_category_counts, get_bubble_labels, set_date_range
 
 LetsPlot.setup_html()
 
@@ -16,22 +16,9 @@ np.random.seed(27)
 
 engine = get_engine()
 
-# this assumes (hopefully, one major category per incident...)
-df = pd.read_sql("""
-     SELECT i.incident_id
-     , i.incident_at::date as date
-     , category
-     , subcategory
-     FROM incident.incident i 
-     JOIN incident.incident_category ic on i.incident_id = ic.incident_id
-     WHERE TRUE
-         and user_id = 1 
-         and category is not null
- """, engine)
-
-
-def get_agg_plot(df: pd.DataFrame, group: List[str]) -> None:
-    agg_df = df.groupby(group, as_index=False)['incident_id'].count().rename(columns={'incident_id': 'n'})
+
+def get_agg_plot(agg_df: pd.DataFrame, group: List[str]) -> None:
+    agg_df = agg_df.reset_index(drop=True)
     n_groups = len(agg_df)
 
     agg_df['x'] = np.arange(n_groups)
@@ -58,7 +45,7 @@ def get_agg_plot(df: pd.DataFrame, group: List[str]) -> None:
             opacity=0.8,
             line=dict(width=1, color='black')
         ),
-        text=agg_df[group[-1]] + '<br>' + agg_df['n'].astype(str),
+        text=get_bubble_labels(agg_df, group[-1]),
         hoverinfo='text',
         textposition="bottom center"
     )])
@@ -87,13 +74,13 @@ def get_agg_plot(df: pd.DataFrame, group: List[str]) -> None:
     return
 
 
-start_date, end_date = set_date_range(df)
+start_date, end_date = set_date_range(engine)
 
-# filter by date
-filtered_df = filter_data_by_date_range(df, start_date, end_date)
+# both levels of counts come back from one query
+counts_df = get_category_counts(engine, start_date=start_date, end_date=end_date)
 
 st.write("# Categories")
-get_agg_plot(filtered_df, ['category'])
+get_agg_plot(counts_df[counts_df.is_category_total], ['category'])
 
 st.write(" # Subcategories")
-get_agg_plot(filtered_df, ['category', 'subcategory'])
+get_agg_plot(counts_df[~counts_df.is_category_total & counts_df.subcategory.notnull()], ['category', 'subcategory'])
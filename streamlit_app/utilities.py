@@ -1,43 +1,570 @@
-from typing import List
+import datetime
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
 
 import pandas as pd
 import streamlit as st
+from sqlalchemy import text
 
+from db_utils import fetch_dataframe
+from streamlit_app.cache import cached_loader
+
+# how many of a page's queries can run at once (each on its own pooled connection), across all sessions
+MAX_CONCURRENT_QUERIES = int(os.environ.get("THRIVE_MAX_CONCURRENT_QUERIES", 4))
+
+# search matches are only counted up to this many; past it, the count is just "more than this"
+SEARCH_COUNT_LIMIT = int(os.environ.get("THRIVE_SEARCH_COUNT_LIMIT", 1000))
+
+# labels that can be filtered on with select_generic_label, and so are safe to put into a query as a column name
+GENERIC_LABELS = ['severity', 'custom_label']
+
+# time series bucket sizes: how to truncate a date to its bucket, and the matching date_range frequency
+TIME_SERIES_BUCKETS = {'D': ('D', 'D'), 'W': ('W', 'W-MON'), 'M': ('M', 'MS')}
+
+# how the loaders' columns are typed: labels with a handful of distinct values as categoricals, free text as arrow
+# backed strings (a fraction of the size of python string objects), and dates as datetime64
+COLUMN_DTYPES = {
+    'incident_id': 'string[pyarrow]',
+    'description': 'string[pyarrow]',
+    'severity': 'category',
+    'custom_label': 'category',
+    'category': 'category',
+    'subcategory': 'category',
+}
+DATE_COLUMNS = ['date']
+# columns that come back as postgres arrays, which can't be fetched with COPY's CSV, so results with any of them go
+# straight to read_sql
+ARRAY_COLUMNS = ['subcategories']
+
+# the columns get_category_level_data can return, and how each is computed (per incident)
+CATEGORY_LEVEL_COLUMNS = {
+    'incident_id': "i.incident_id",
+    'date': "i.incident_at::date",
+    'severity': "i.severity",
+    'custom_label': "i.custom_label",
+    'description': "i.description",
+    'category': "string_agg(distinct ic.category, ', ')",
+    'subcategories': "coalesce(array_agg(distinct ic.subcategory) FILTER (WHERE ic.subcategory is not null), "
+                     "ARRAY[]::varchar[])",
+}
+
+# the columns get_subcategory_level_data can return (per incident and subcategory)
+SUBCATEGORY_LEVEL_COLUMNS = {
+    'incident_id': "i.incident_id",
+    'date': "i.incident_at::date",
+    'severity': "i.severity",
+    'custom_label': "i.custom_label",
+    'description': "i.description",
+    'category': "ic.category",
+    'subcategory': "ic.subcategory",
+}
+
+
+def select_columns(column_expressions: Dict[str, str], columns: Optional[Tuple[str, ...]] = None) -> str:
+    """
+    Builds a SELECT list out of the requested columns
+    :param column_expressions: column name -> SQL expression, for every column that can be requested
+    :param columns: columns to select, or None for all of them
+    """
+    columns = columns or tuple(column_expressions)
+    unknown_columns = [column for column in columns if column not in column_expressions]
+    if unknown_columns:
+        raise ValueError(f"Unknown columns {unknown_columns}, must be from {list(column_expressions)}")
+
+    return '\n        , '.join(f"{column_expressions[column]} as {column}" for column in columns)
+
+
+def get_fetch_method(columns: Optional[Tuple[str, ...]]) -> Optional[str]:
+    """
+    How to fetch a get_category_level_data style result with these columns (None for all of them): the default
+    method, unless there is an array column
+    """
+    columns = columns or tuple(CATEGORY_LEVEL_COLUMNS)
+    return 'read_sql' if any(column in ARRAY_COLUMNS for column in columns) else None
+
+
+def set_column_types(df: pd.DataFrame) -> pd.DataFrame:
+    for column in df.columns:
+        if column in DATE_COLUMNS:
+            df[column] = pd.to_datetime(df[column])
+        elif column in COLUMN_DTYPES:
+            df[column] = df[column].astype(COLUMN_DTYPES[column])
+
+    return df
+
+
+def incident_filters(start_date: Optional[datetime.date] = None, end_date: Optional[datetime.date] = None,
+                     severity: Optional[str] = None, custom_label: Optional[str] = None,
+                     category: Optional[str] = None,
+                     subcategories: Optional[Tuple[str, ...]] = None) -> Tuple[str, Dict]:
+    """
+    Builds the WHERE conditions (on incident.incident aliased as `i`) and bind parameters for the dashboard's filters.
+    Any filter left as None isn't applied
+    :param start_date: first date to include; incidents with no date are always kept, as in the pages' date filter
+    :param end_date: last date to include
+    :param severity: severity to keep, case insensitive
+    :param custom_label: custom label to keep, case insensitive
+    :param category: keep incidents with at least one subcategory in this category
+    :param subcategories: keep incidents with at least one of these subcategories
+    :return: conditions (each starting with `and`), and their parameters
+    """
+    conditions, params = [], {}
+
+    # compare the raw timestamp against the range (rather than incident_at::date) so the (user_id, incident_at) index
+    # can be used
+    if start_date is not None:
+        conditions.append("and (i.incident_at >= :start_date or i.incident_at is null)")
+        params['start_date'] = start_date
+    if end_date is not None:
+        conditions.append("and (i.incident_at < :end_date_exclusive or i.incident_at is null)")
+        params['end_date_exclusive'] = end_date + datetime.timedelta(days=1)
+
+    # written exactly as the (user_id, lower(label), incident_at) expression indexes are, so they get used
+    if severity is not None:
+        conditions.append("and lower(i.severity) = lower(:severity)")
+        params['severity'] = severity
+    if custom_label is not None:
+        conditions.append("and lower(i.custom_label) = lower(:custom_label)")
+        params['custom_label'] = custom_label
+
+    if category is not None:
+        conditions.append("""and exists (
+                SELECT 1 FROM incident.incident_category fc
+                WHERE fc.incident_id = i.incident_id and fc.category = :category)""")
+        params['category'] = category
+
+    # an exact match on the (subcategory, incident_id) index, rather than substring matching the aggregated names
+    if subcategories:
+        conditions.append("""and exists (
+                SELECT 1 FROM incident.incident_category fs
+                WHERE fs.incident_id = i.incident_id and fs.subcategory = any(:subcategories))""")
+        params['subcategories'] = list(subcategories)
+
+    return '\n            '.join(conditions), params
+
+
+@cached_loader
+def get_category_level_data(engine, start_date: Optional[datetime.date] = None,
+                            end_date: Optional[datetime.date] = None, severity: Optional[str] = None,
+                            custom_label: Optional[str] = None, category: Optional[str] = None,
+                            subcategories: Optional[Tuple[str, ...]] = None,
+                            columns: Optional[Tuple[str, ...]] = None) -> pd.DataFrame:
+    """
+    One row per dated incident, with its categories joined into one string and its subcategories as a list
+    :param columns: the columns (of CATEGORY_LEVEL_COLUMNS) the page needs; all of them if None
+    """
+    filters, params = incident_filters(start_date, end_date, severity, custom_label, category, subcategories)
 
-def get_category_level_data(engine) -> pd.DataFrame:
     # this assumes (hopefully, one major category per incident...)
-    return pd.read_sql("""
-        SELECT i.incident_id
-        , incident_at::date as date
-        , severity, custom_label, description
-        , string_agg(distinct category, ', ') as category
-        , string_agg(distinct subcategory, ', ') as subcategories
-        FROM incident.incident i 
+    # (the other incident columns can be selected when grouping by just incident_id, since it is the primary key)
+    return set_column_types(fetch_dataframe(engine, text(f"""
+        SELECT {select_columns(CATEGORY_LEVEL_COLUMNS, columns)}
+        FROM incident.incident i
         LEFT JOIN incident.incident_category ic on i.incident_id = ic.incident_id
         WHERE TRUE
-            and user_id = 1 
+            and user_id = 1
             and incident_at is not null
-        GROUP BY 1,2,3,4,5
-    """, engine)
+            {filters}
+        GROUP BY i.incident_id
+    """), params, method=get_fetch_method(columns)))
+
+
+@cached_loader
+def get_incident_page(engine, after: Optional[Tuple[pd.Timestamp, str]] = None, page_size: int = 50,
+                      newest_first: bool = True, severity: Optional[str] = None, custom_label: Optional[str] = None,
+                      subcategories: Optional[Tuple[str, ...]] = None,
+                      columns: Optional[Tuple[str, ...]] = None) -> pd.DataFrame:
+    """
+    One page of `get_category_level_data`'s rows, in (incident_at, incident_id) order, using keyset pagination: each
+    page starts right after the previous page's last row, so fetching any page costs the same however deep it is
+    :param after: (cursor_at, cursor_id) of the previous page's last row, or None for the first page
+    :param page_size: rows per page
+    :param newest_first: sort newest to oldest, otherwise oldest to newest
+    :param columns: the columns (of CATEGORY_LEVEL_COLUMNS) the page needs; all of them if None
+    :return: the page, plus `cursor_at` and `cursor_id` columns to page on from
+    """
+    filters, params = incident_filters(severity=severity, custom_label=custom_label, subcategories=subcategories)
+    direction, comparison = ('desc', '<') if newest_first else ('asc', '>')
+    if after is not None:
+        filters += f"\n                and (i.incident_at, i.incident_id) {comparison} (:after_at, :after_id)"
+        params.update({'after_at': after[0], 'after_id': after[1]})
+    params['page_size'] = page_size
+
+    # pick the page's incidents first (straight off the (user_id, incident_at, incident_id) index), and only then
+    # aggregate their categories
+    return set_column_types(fetch_dataframe(engine, text(f"""
+        SELECT {select_columns(CATEGORY_LEVEL_COLUMNS, columns)}
+        , i.incident_at as cursor_at
+        , i.incident_id::text as cursor_id
+        FROM (
+            SELECT i.incident_id, i.incident_at, i.severity, i.custom_label, i.description
+            FROM incident.incident i
+            WHERE TRUE
+                and user_id = 1
+                and incident_at is not null
+                {filters}
+            ORDER BY i.incident_at {direction}, i.incident_id {direction}
+            LIMIT :page_size
+        ) i
+        LEFT JOIN incident.incident_category ic on i.incident_id = ic.incident_id
+        GROUP BY i.incident_id, i.incident_at, i.severity, i.custom_label, i.description
+        ORDER BY i.incident_at {direction}, i.incident_id {direction}
+    """), params, method=get_fetch_method(columns)))
+
+
+@cached_loader
+def search_incidents(engine, search: str, offset: int = 0, page_size: int = 50, severity: Optional[str] = None,
+                     custom_label: Optional[str] = None, subcategories: Optional[Tuple[str, ...]] = None,
+                     columns: Optional[Tuple[str, ...]] = None) -> pd.DataFrame:
+    """
+    One page of the incidents whose descriptions match a full text search, best matches first, using the GIN index
+    on incident.description_tsv.  Undated incidents are included.  See `count_search_matches` for the total
+    :param search: search terms, in web search syntax: words, "quoted phrases", `or`, and `-excluded` words
+    :param offset: number of matches to skip (results are in rank order, so they're paged by position)
+    :param page_size: rows per page
+    :param columns: the columns (of CATEGORY_LEVEL_COLUMNS) the page needs; all of them if None
+    :return: the page, plus a `rank` column
+    """
+    filters, params = incident_filters(severity=severity, custom_label=custom_label, subcategories=subcategories)
+    params.update({'search': search, 'offset': offset, 'page_size': page_size})
+
+    return set_column_types(fetch_dataframe(engine, text(f"""
+        WITH matches AS (
+            SELECT i.incident_id, i.incident_at, i.severity, i.custom_label, i.description
+            , ts_rank(i.description_tsv, q) as rank
+            FROM incident.incident i
+            , websearch_to_tsquery('english', :search) q
+            WHERE TRUE
+                and user_id = 1
+                and i.description_tsv @@ q
+                {filters}
+            ORDER BY rank desc, i.incident_at desc nulls last, i.incident_id
+            LIMIT :page_size OFFSET :offset
+        )
+        SELECT {select_columns(CATEGORY_LEVEL_COLUMNS, columns)}
+        , i.rank
+        FROM matches i
+        LEFT JOIN incident.incident_category ic on i.incident_id = ic.incident_id
+        GROUP BY i.incident_id, i.incident_at, i.severity, i.custom_label, i.description, i.rank
+        ORDER BY i.rank desc, i.incident_at desc nulls last, i.incident_id
+    """), params, method=get_fetch_method(columns)))
+
+
+@cached_loader
+def count_search_matches(engine, search: str, severity: Optional[str] = None, custom_label: Optional[str] = None,
+                         subcategories: Optional[Tuple[str, ...]] = None,
+                         limit: int = SEARCH_COUNT_LIMIT) -> pd.DataFrame:
+    """
+    The number of incidents `search_incidents` matches, for the same filters, counted only up to `limit` + 1: a
+    common word can match most of the table, and there's no need to find every match just to say there are lots
+    :return: `n`, which is `limit` + 1 when there are more than `limit` matches
+    """
+    filters, params = incident_filters(severity=severity, custom_label=custom_label, subcategories=subcategories)
+    params.update({'search': search, 'limit': limit + 1})
+
+    return fetch_dataframe(engine, text(f"""
+        SELECT count(*) as n
+        FROM (
+            SELECT 1
+            FROM incident.incident i
+            , websearch_to_tsquery('english', :search) q
+            WHERE TRUE
+                and user_id = 1
+                and i.description_tsv @@ q
+                {filters}
+            LIMIT :limit
+        ) m
+    """), params)
 
 
-def get_subcategory_level_data(engine) -> pd.DataFrame:
+@cached_loader
+def get_incident_count(engine, severity: Optional[str] = None, custom_label: Optional[str] = None,
+                       subcategories: Optional[Tuple[str, ...]] = None) -> pd.DataFrame:
+    # the total behind get_incident_page, for the same filters
+    filters, params = incident_filters(severity=severity, custom_label=custom_label, subcategories=subcategories)
+
+    return fetch_dataframe(engine, text(f"""
+        SELECT count(*) as n
+        FROM incident.incident i
+        WHERE TRUE
+            and user_id = 1
+            and incident_at is not null
+            {filters}
+    """), params)
+
+
+@cached_loader
+def get_subcategory_level_data(engine, start_date: Optional[datetime.date] = None,
+                               end_date: Optional[datetime.date] = None, severity: Optional[str] = None,
+                               custom_label: Optional[str] = None, category: Optional[str] = None,
+                               columns: Optional[Tuple[str, ...]] = None) -> pd.DataFrame:
+    """
+    One row per incident and subcategory (including undated and uncategorized incidents)
+    :param columns: the columns (of SUBCATEGORY_LEVEL_COLUMNS) the page needs; all of them if None
+    """
+    filters, params = incident_filters(start_date, end_date, severity, custom_label, category)
+
     # this assumes (hopefully, one major category per incident...)
-    return pd.read_sql("""
+    return set_column_types(fetch_dataframe(engine, text(f"""
+        SELECT {select_columns(SUBCATEGORY_LEVEL_COLUMNS, columns)}
+        FROM incident.incident i
+        LEFT JOIN incident.incident_category ic on i.incident_id = ic.incident_id
+        WHERE TRUE
+            and user_id = 1
+            {filters}
+    """), params))
+
+
+@cached_loader
+def get_category_counts(engine, start_date: Optional[datetime.date] = None,
+                        end_date: Optional[datetime.date] = None) -> pd.DataFrame:
+    """
+    Number of incident/subcategory pairs per category, and per category and subcategory, in one pass.  Rows with
+    `is_category_total` are the per category counts (with no subcategory)
+    """
+    filters, params = incident_filters(start_date, end_date)
+
+    return set_column_types(fetch_dataframe(engine, text(f"""
+        SELECT category
+        , subcategory
+        , grouping(subcategory) = 1 as is_category_total
+        , count(*) as n
+        FROM incident.incident i
+        JOIN incident.incident_category ic on i.incident_id = ic.incident_id
+        WHERE TRUE
+            and user_id = 1
+            and category is not null
+            {filters}
+        GROUP BY GROUPING SETS ((category), (category, subcategory))
+        ORDER BY category, subcategory
+    """), params))
+
+
+@cached_loader
+def get_calendar_events(engine, start_date: datetime.date, end_date: datetime.date,
+                        severity: Optional[str] = None) -> pd.DataFrame:
+    """
+    One row per incident and category in a date range, with its subcategories joined into one string, for the
+    calendar.  Like the grouping this replaced, incidents without a date, severity, custom label or category are left
+    out
+    """
+    filters, params = incident_filters(start_date, end_date, severity)
+
+    return set_column_types(fetch_dataframe(engine, text(f"""
         SELECT i.incident_id
         , incident_at::date as date
         , severity, custom_label, description
         , category
-        , subcategory
-        FROM incident.incident i 
-        LEFT JOIN incident.incident_category ic on i.incident_id = ic.incident_id
+        , string_agg(subcategory, ', ') as subcategory
+        FROM incident.incident i
+        JOIN incident.incident_category ic on i.incident_id = ic.incident_id
         WHERE TRUE
-            and user_id = 1 
-    """, engine)
+            and user_id = 1
+            and incident_at is not null
+            and severity is not null
+            and custom_label is not null
+            and category is not null
+            {filters}
+        GROUP BY 1,2,3,4,5,6
+    """), params))
+
+
+@cached_loader
+def get_daily_counts(engine, start_date: Optional[datetime.date] = None, end_date: Optional[datetime.date] = None,
+                     severity: Optional[str] = None, custom_label: Optional[str] = None,
+                     category: Optional[str] = None) -> pd.DataFrame:
+    """
+    Number of incidents per date, category, custom label and severity, from the incident.daily_counts rollup.
+    Takes the same filters as the incident loaders, but (like `get_category_level_data`) has no undated incidents
+    """
+    conditions, params = [], {}
+    if start_date is not None:
+        conditions.append("and date >= :start_date")
+        params['start_date'] = start_date
+    if end_date is not None:
+        conditions.append("and date <= :end_date")
+        params['end_date'] = end_date
+    if severity is not None:
+        conditions.append("and lower(severity) = lower(:severity)")
+        params['severity'] = severity
+    if custom_label is not None:
+        conditions.append("and lower(custom_label) = lower(:custom_label)")
+        params['custom_label'] = custom_label
+    if category is not None:
+        conditions.append("and :category = any(string_to_array(category, ', '))")
+        params['category'] = category
+    filters = '\n            '.join(conditions)
+
+    return set_column_types(fetch_dataframe(engine, text(f"""
+        SELECT date
+        , category, custom_label, severity
+        , n_incidents as n
+        FROM incident.daily_counts
+        WHERE TRUE
+            and user_id = 1
+            {filters}
+    """), params))
+
+
+@cached_loader
+def get_subcategory_options(engine) -> pd.DataFrame:
+    return fetch_dataframe(engine, """
+        SELECT subcategory
+        FROM incident.category
+
+        UNION
+
+        SELECT distinct subcategory
+        FROM incident.incident_category
+    """)
+
+
+@cached_loader
+def get_date_bounds(engine) -> pd.DataFrame:
+    # answered from the ends of the (user_id, incident_at) index, so it stays cheap however much history there is
+    return fetch_dataframe(engine, """
+        SELECT min(incident_at)::date as min_date
+        , max(incident_at)::date as max_date
+        FROM incident.incident
+        WHERE user_id = 1
+    """)
+
+
+@cached_loader
+def get_label_options(engine, label: str) -> pd.DataFrame:
+    if label not in GENERIC_LABELS:
+        raise ValueError(f"Unknown label {label}, must be one of {GENERIC_LABELS}")
+
+    return fetch_dataframe(engine, f"""
+        SELECT distinct {label} as label
+        FROM incident.incident
+        WHERE user_id = 1
+            and {label} is not null
+        ORDER BY 1
+    """)
+
+
+def build_time_series(df: pd.DataFrame, group_columns: Optional[List[str]] = None, freq: str = 'D',
+                      rolling_window: Optional[int] = None, start_date: Optional[datetime.date] = None,
+                      end_date: Optional[datetime.date] = None, date_column: str = 'date',
+                      value_column: Optional[str] = 'n') -> pd.DataFrame:
+    """
+    Totals counts per date bucket and group, with a row (of 0) for every bucket/group combination that has none, so
+    lines and rolling means don't skip over quiet periods
+    :param df: data with a date column, and optionally a column of counts (otherwise each row counts as 1)
+    :param group_columns: columns to split the series by (e.g. ['custom_label']); missing values are a group too
+    :param freq: bucket size: 'D' (day), 'W' (week, starting Monday) or 'M' (month)
+    :param rolling_window: if given, also adds `<value_column>_rolling`, the mean over this many buckets
+    :param start_date: first date to fill from; defaults to the earliest date in the data
+    :param end_date: last date to fill to; defaults to the latest date in the data
+    :param date_column: column with the dates
+    :param value_column: column with the counts, or None to count rows
+    :return: one row per bucket (labelled by its first day) and group, with the date, group and count columns
+    """
+    if freq not in TIME_SERIES_BUCKETS:
+        raise ValueError(f"Unknown frequency {freq}, must be one of {list(TIME_SERIES_BUCKETS)}")
+    period, date_range_freq = TIME_SERIES_BUCKETS[freq]
+    group_columns = group_columns or []
+    output_column = value_column or 'n'
+
+    if df.empty:
+        return pd.DataFrame(columns=[date_column] + group_columns + [output_column]
+                            + ([f'{output_column}_rolling'] if rolling_window else []))
+
+    dates = pd.to_datetime(df[date_column])
+    buckets = dates.dt.to_period(period).dt.start_time
+    values = df[value_column] if value_column else pd.Series(1, index=df.index)
+
+    counts = values.groupby([buckets] + [df[column] for column in group_columns], dropna=False, observed=True).sum()
 
+    # bucket the bounds too, so the grid lines up with the buckets above
+    start = pd.Period(start_date if start_date is not None else dates.min(), period).start_time
+    end = pd.Period(end_date if end_date is not None else dates.max(), period).start_time
+    grid = pd.date_range(start, end, freq=date_range_freq, name=date_column)
+    if group_columns:
+        grid = pd.MultiIndex.from_product([grid] + [df[column].drop_duplicates() for column in group_columns],
+                                          names=[date_column] + group_columns)
+    else:
+        counts.index.name = date_column
+    series_df = counts.reindex(grid, fill_value=0).rename(output_column).to_frame()
+
+    if rolling_window:
+        def rolling_mean(series: pd.Series) -> pd.Series:
+            return series.rolling(rolling_window, min_periods=1).mean()
+
+        # the grid is date-major, so each group's rows are already in date order
+        column = series_df[output_column]
+        series_df[f'{output_column}_rolling'] = rolling_mean(column) if not group_columns else \
+            column.groupby(level=group_columns, dropna=False, sort=False, observed=True).transform(rolling_mean)
+
+    return series_df.reset_index()
+
+
+def get_bubble_labels(agg_df: pd.DataFrame, label_column: str, value_column: str = 'n') -> pd.Series:
+    """
+    "<label><br><count>" for each row, for the Categories page's bubbles.  The loaders return labels as
+    categoricals, which can't be added to strings, so they're converted first
+    """
+    return agg_df[label_column].astype(str) + '<br>' + agg_df[value_column].astype(str)
+
+
+@st.cache_resource
+def get_query_slots() -> threading.BoundedSemaphore:
+    # shared by the whole server, so concurrent sessions can't open unbounded connections between them
+    return threading.BoundedSemaphore(MAX_CONCURRENT_QUERIES)
+
+
+def load_concurrently(engine, **loads: Tuple[Callable, Dict]) -> Dict[str, pd.DataFrame]:
+    """
+    Runs several independent loaders at the same time, so a page waits for its slowest query rather than for all of
+    them in turn, e.g.
+
+        results = load_concurrently(engine, page=(get_incident_page, {'page_size': 50}),
+                                    count=(get_incident_count, {}))
+
+    At most MAX_CONCURRENT_QUERIES loaders run at once, across all sessions.
+    :param engine: engine to run the loaders on; each runs on its own connection from its pool
+    :param loads: name -> (loader, keyword arguments for it)
+    :return: name -> the loader's result
+    """
+    try:
+        from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+        ctx = get_script_run_ctx()
+    except ImportError:
+        add_script_run_ctx, ctx = None, None
+
+    query_slots = get_query_slots()
+
+    def run(loader: Callable, kwargs: Dict) -> pd.DataFrame:
+        # lets the loaders use st.* (e.g. the shared caches) from the query threads
+        if ctx is not None:
+            add_script_run_ctx(ctx=ctx)
+        with query_slots:
+            return loader(engine, **kwargs)
+
+    # the threads only live as long as this run, so they can't hold on to its script run context (and its session)
+    # once it is over
+    with ThreadPoolExecutor(max_workers=len(loads) or 1, thread_name_prefix='thrive-query') as executor:
+        futures = {name: executor.submit(run, loader, kwargs) for name, (loader, kwargs) in loads.items()}
+
+        return {name: future.result() for name, future in futures.items()}
+
+
+def set_date_range(engine, date_bounds: Optional[pd.DataFrame] = None) -> (datetime.date, datetime.date):
+    """
+    Shows the date range picker, between the first and last incident dates
+    :param date_bounds: `get_date_bounds`' result, if the page already has it (e.g. from `load_concurrently`)
+    """
+    if date_bounds is None:
+        date_bounds = get_date_bounds(engine)
+    bounds = date_bounds.iloc[0]
+    min_date, max_date = bounds.min_date, bounds.max_date
+    if pd.isnull(min_date):
+        st.write("No dated incidents to display")
+        st.stop()
 
-def set_date_range(df: pd.DataFrame) -> (str, str):
-    min_date, max_date = df[df.date.notnull()].date.min(), df[df.date.notnull()].date.max()
     dates = st.date_input("Choose a date range (type in, or use drop down):",
                           value=(min_date, max_date),
                           min_value=min_date,
@@ -59,14 +586,27 @@ def filter_data_by_date_range(filtered_df: pd.DataFrame, start_date: str, end_da
     return filtered_df
 
 
-def filter_by_generic_label(label: str, label_possibilities: List[str], df: pd.DataFrame) -> pd.DataFrame:
+def select_generic_label(label: str, label_possibilities: List[str]) -> Optional[str]:
+    """
+    Shows a drop down to pick one value of a label, to be passed on to the loaders' filters
+    :return: the chosen value, or None for all of them
+    """
     displayed_label = label.replace("_", " ").capitalize()
     filtered_label = st.selectbox(f"Select {displayed_label}:", ['All'] + label_possibilities)
 
+    if filtered_label == 'All':
+        return None
+
+    st.write(f"Showing only {displayed_label}: {filtered_label}")
+    return filtered_label
+
+
+def filter_by_generic_label(label: str, label_possibilities: List[str], df: pd.DataFrame) -> pd.DataFrame:
+    filtered_label = select_generic_label(label, label_possibilities)
+
     # filter by custom label
-    if filtered_label != 'All':
+    if filtered_label is not None:
         filtered_df = df[df[label].str.capitalize() == filtered_label]
-        st.write(f"Showing only {displayed_label}: {filtered_label}")
 
     else:
         filtered_df = df
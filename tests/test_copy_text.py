@@ -0,0 +1,32 @@
+import pandas as pd
+import pytest
+
+from db_utils import to_copy_text
+
+TRICKY_TEXT = ["tab\there", "new\nline", "back\\slash", "carriage\rreturn", None]
+ESCAPED_TEXT = ["tab\\there", "new\\nline", "back\\\\slash", "carriage\\rreturn", "\\N"]
+
+
+@pytest.mark.parametrize('dtype', [object, 'string', 'string[pyarrow]', 'category'])
+def test_text_is_escaped_whatever_its_dtype(dtype):
+    df = pd.DataFrame({'user_id': range(len(TRICKY_TEXT)), 'description': pd.Series(TRICKY_TEXT, dtype=dtype)})
+
+    lines = to_copy_text(df).split('\n')
+
+    # one line per row (plus the empty one after the final newline), each with exactly one tab between the columns
+    assert lines[-1] == ''
+    assert [line.split('\t') for line in lines[:-1]] == [[str(i), escaped] for i, escaped in enumerate(ESCAPED_TEXT)]
+
+
+def test_other_types():
+    df = pd.DataFrame({
+        'n': pd.Series([1, None], dtype='Int64'),
+        'is_flagged': [True, False],
+        'incident_at': pd.to_datetime(['2024-01-02 03:04:05.000006', None]),
+    })
+
+    assert to_copy_text(df) == "1\tt\t2024-01-02 03:04:05.000006\n\\N\tf\t\\N\n"
+
+
+def test_empty():
+    assert to_copy_text(pd.DataFrame({'description': pd.Series([], dtype='string')})) == ''
@@ -0,0 +1,94 @@
+import calendar
+import datetime
+
+import pandas as pd
+import pytest
+
+from data_processing.utilities import estimate_dates, get_incident_random_fractions
+
+# a period spanning new year, so both candidate years come up
+PERIOD_START = pd.Timestamp('2022-11-01')
+PERIOD_END = pd.Timestamp('2023-02-28')
+
+
+def estimate_date(parsed_date: str, period_start_date: pd.Timestamp, period_end_date: pd.Timestamp,
+                  random_fraction: float) -> pd.Timestamp:
+    # the original scalar version, one incident at a time, as the reference for the columnar one.  The random draw
+    # is passed in, and a date that doesn't exist in one candidate year goes on to the next
+    if parsed_date is None:
+        period_ns = (period_end_date - period_start_date).value
+        return (period_start_date + pd.Timedelta(int(random_fraction * period_ns), unit='ns')).floor('us')
+
+    for period_date in [period_start_date, period_end_date]:
+        split_parsed_date = parsed_date.split(" ")
+        month = split_parsed_date[0].capitalize()
+        month_format = "%B" if month in calendar.month_name else "%b"
+        month_num = datetime.datetime.strptime(month, month_format).month
+
+        if len(split_parsed_date) > 1 and split_parsed_date[1].isnumeric():
+            day = int(split_parsed_date[1])
+        else:
+            day = int(random_fraction * calendar.monthrange(period_date.year, month_num)[1]) + 1
+
+        try:
+            try_date = pd.Timestamp(datetime.datetime(period_date.year, month_num, day))
+        except ValueError:
+            continue
+        if period_start_date <= try_date <= period_end_date:
+            return try_date
+
+    raise ValueError(f"Cannot find adequate date for {parsed_date} between {period_start_date} and {period_end_date}")
+
+
+def make_incidents(parsed_dates) -> pd.DataFrame:
+    return pd.DataFrame({'parsed_date': pd.Series(parsed_dates, dtype=object),
+                         'period_start_date': PERIOD_START,
+                         'period_end_date': PERIOD_END,
+                         'description_hash': [f"hash-{i}" for i in range(len(parsed_dates))]})
+
+
+def run_estimate_dates(incident_df: pd.DataFrame) -> pd.Series:
+    return estimate_dates(incident_df.parsed_date, incident_df.period_start_date, incident_df.period_end_date,
+                          incident_df.description_hash)
+
+
+def test_estimate_dates_matches_scalar():
+    incident_df = make_incidents(["Nov 15", "Jan 28", "december", "Feb", "january", "Dec 31", "Feb 28", None, None])
+
+    incident_at = run_estimate_dates(incident_df)
+
+    fractions = get_incident_random_fractions(incident_df.description_hash, incident_df.period_start_date,
+                                              incident_df.period_end_date)
+    assert list(incident_at) == [estimate_date(d, PERIOD_START, PERIOD_END, f)
+                                 for d, f in zip(incident_df.parsed_date, fractions)]
+
+
+def test_both_candidate_years_are_tried():
+    incident_at = run_estimate_dates(make_incidents(["Nov 15", "Jan 28"]))
+
+    assert list(incident_at) == [pd.Timestamp('2022-11-15'), pd.Timestamp('2023-01-28')]
+
+
+def test_month_only_lands_in_that_month():
+    incident_at = run_estimate_dates(make_incidents(["december", "Feb"] * 10))
+
+    assert list(incident_at.dt.to_period('M').astype(str).unique()) == ['2022-12', '2023-02']
+
+
+@pytest.mark.parametrize('bad_date', ["Jan 0", "Feb 30", "June 3", "Smarch 3"])
+def test_unresolved_dates_are_reported_together(bad_date):
+    with pytest.raises(ValueError, match=r"Cannot find adequate date for 2 incident\(s\)") as error:
+        run_estimate_dates(make_incidents(["Jan 28", bad_date, None, bad_date]))
+
+    assert str(error.value).count(bad_date) == 2
+
+
+@pytest.mark.parametrize('parsed_date', [None, "december"])
+def test_dates_dont_depend_on_other_incidents(parsed_date):
+    incident_df = make_incidents([parsed_date]).assign(description_hash='the-incident')
+    others_df = make_incidents([None, "january", None, "Feb"])
+
+    alone = run_estimate_dates(incident_df)
+    with_others = run_estimate_dates(pd.concat([others_df, incident_df], ignore_index=True))
+
+    assert with_others.iloc[-1] == alone.iloc[0]
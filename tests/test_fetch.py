@@ -0,0 +1,27 @@
+from collections import namedtuple
+
+import db_utils
+from db_utils import get_result_columns
+
+Column = namedtuple('Column', ['name', 'type_code'])
+
+
+class FakeCursor:
+    def __init__(self):
+        self.executed = []
+        self.description = [Column('date', 1082), Column('subcategories', 1015)]
+
+    def execute(self, sql):
+        self.executed.append(sql)
+
+
+def test_result_columns_are_looked_up_once_per_statement(monkeypatch):
+    monkeypatch.setattr(db_utils, '_result_columns', {})
+    cursor = FakeCursor()
+    statement = "SELECT date, subcategories FROM t WHERE x = %(x)s"
+
+    first = get_result_columns(cursor, statement, "SELECT date, subcategories FROM t WHERE x = 1")
+    second = get_result_columns(cursor, statement, "SELECT date, subcategories FROM t WHERE x = 2")
+
+    assert first == second == [('date', 1082), ('subcategories', 1015)]
+    assert cursor.executed == ["SELECT * FROM (SELECT date, subcategories FROM t WHERE x = 1) q LIMIT 0"]
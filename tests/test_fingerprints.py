@@ -0,0 +1,53 @@
+import pandas as pd
+
+from data_processing.utilities import IncidentFingerprints
+
+
+def make_upload_df(rows) -> pd.DataFrame:
+    return pd.DataFrame({'user_id': 1,
+                         'incident_at': pd.to_datetime([incident_at for _, incident_at in rows]),
+                         'description': [h for h, _ in rows],
+                         'description_hash': [h for h, _ in rows]})
+
+
+def run_delta_ingest(stored: dict, batches: list) -> int:
+    """
+    One delta mode run against a fake db: filters each batch against fingerprints of what is stored, then upserts
+    what is left the way `merge_tmp_incident` does (the earliest staged copy wins).  Returns the rows uploaded
+    """
+    fingerprints = IncidentFingerprints(dict(stored))
+    staged = pd.concat([fingerprints.filter_changed(make_upload_df(batch)) for batch in batches])
+
+    upserted = staged.sort_values('incident_at', na_position='last').drop_duplicates('description_hash')
+    stored.update(zip(upserted.description_hash, IncidentFingerprints.format_incident_at(upserted.incident_at)))
+
+    assert fingerprints.fingerprints == stored
+    return len(staged)
+
+
+def test_repeated_description_keeps_its_earliest_date():
+    t1, t2 = '2023-01-05 00:00:00.000000', '2023-02-10 00:00:00.000000'
+    stored = {}
+
+    # the same description at two dates, in one batch and then split across batches in either order
+    runs = [[[('a', t2), ('b', t1), ('a', t1)]], [[('a', t2)], [('a', t1), ('b', t1)]],
+            [[('a', t1), ('b', t1)], [('a', t2)]], [[('a', t2), ('a', t1), ('b', t1)]]]
+    uploaded = []
+    for batches in runs:
+        uploaded.append(run_delta_ingest(
+            stored, [[(h, pd.Timestamp(t)) for h, t in batch] for batch in batches]))
+        assert stored == {'a': t1, 'b': t1}
+
+    # only the first run has anything new; the later copy of `a` is never uploaded over the earlier one
+    assert uploaded[0] == 2
+    assert uploaded[2:] == [0, 0]
+
+
+def test_undated_copy_loses_to_a_dated_one():
+    stored = {'a': '2023-01-05 00:00:00.000000'}
+
+    run_delta_ingest(stored, [[('a', None)], [('a', pd.Timestamp('2023-01-05'))]])
+    assert stored == {'a': '2023-01-05 00:00:00.000000'}
+
+    assert run_delta_ingest(stored, [[('a', pd.Timestamp('2023-01-05')), ('a', None)]]) == 0
+    assert stored == {'a': '2023-01-05 00:00:00.000000'}
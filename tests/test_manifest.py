@@ -0,0 +1,159 @@
+import hashlib
+import os
+
+import pandas as pd
+
+from data_processing.manifest import IngestionManifest
+from data_processing.read_mkdown_file import ShardReader, iter_shards, transform_shard
+
+FIRST_PART = """# Nov 2022-Feb 2023
+- [Nov 3] Missed pickup by 20 minutes.
+- january. Cancelled the weekend visit.
+- Argued in front of child.
+
+# Mar 2023-Apr 2023
+- [Mar 4] Forgot the medication.
+"""
+
+APPENDED_PART = """- Late to drop-off again.
+- [april] Did not share the school calendar.
+"""
+
+
+class IncidentFile:
+    """
+    An incident file, plus a fresh manifest on every ingestion that reads the previous run's state from disk, the
+    same as separate runs of the ingestion script
+    """
+
+    def __init__(self, tmp_path, text: str):
+        self.path = str(tmp_path / 'incidents.txt')
+        self.manifest_file = str(tmp_path / 'manifest.json')
+        self.mtime = 1_700_000_000
+        self.write(text)
+
+    def write(self, text: str, mode: str = 'w') -> None:
+        with open(self.path, mode) as file:
+            file.write(text)
+        # bump the mtime explicitly, since two writes can land within the file system's mtime resolution
+        self.mtime += 10
+        os.utime(self.path, (self.mtime, self.mtime))
+
+    def ingest(self):
+        """
+        :return: the plan that was made, and the incidents parsed under it
+        """
+        manifest = IngestionManifest(self.manifest_file)
+        plan = manifest.plan(self.path)
+        shards = list(iter_shards([self.path], 64, manifest))
+        manifest.save()
+
+        return plan, transform_upload_dfs(shards)
+
+    def entry(self):
+        return IngestionManifest(self.manifest_file).entries[os.path.abspath(self.path)]
+
+
+def transform_upload_dfs(shards) -> pd.DataFrame:
+    upload_dfs = [transform_shard(shard, infer_dates=True) for shard in shards]
+    return pd.concat(upload_dfs, ignore_index=True) if upload_dfs else pd.DataFrame()
+
+
+def full_parse(path: str) -> pd.DataFrame:
+    return transform_upload_dfs(ShardReader(path, 64))
+
+
+def assert_recorded_whole_file(incident_file: IncidentFile, period_header: str) -> None:
+    with open(incident_file.path, 'rb') as file:
+        data = file.read()
+
+    entry = incident_file.entry()
+    assert (entry.offset, entry.size, entry.mtime) == (len(data), len(data), incident_file.mtime)
+    assert entry.checksum == hashlib.sha256(data).hexdigest()
+    assert entry.period_header == period_header
+
+
+def test_new_file_is_parsed_in_full(tmp_path):
+    incident_file = IncidentFile(tmp_path, FIRST_PART)
+
+    plan, upload_df = incident_file.ingest()
+
+    assert (plan.start, plan.period_header) == (0, None)
+    pd.testing.assert_frame_equal(upload_df, full_parse(incident_file.path))
+    assert_recorded_whole_file(incident_file, '# Mar 2023-Apr 2023')
+
+
+def test_unchanged_file_is_skipped(tmp_path):
+    incident_file = IncidentFile(tmp_path, FIRST_PART)
+    incident_file.ingest()
+
+    plan, upload_df = incident_file.ingest()
+
+    assert plan is None
+    assert upload_df.empty
+
+
+def test_append_resumes_with_the_period_header(tmp_path):
+    incident_file = IncidentFile(tmp_path, FIRST_PART)
+    incident_file.ingest()
+    incident_file.write(APPENDED_PART, mode='a')
+
+    plan, upload_df = incident_file.ingest()
+
+    assert (plan.start, plan.period_header) == (len(FIRST_PART.encode()), '# Mar 2023-Apr 2023')
+    # the appended incidents come out exactly as they do when the whole file is parsed
+    full_df = full_parse(incident_file.path)
+    assert len(upload_df) == 2
+    pd.testing.assert_frame_equal(upload_df, full_df.tail(len(upload_df)).reset_index(drop=True))
+    assert_recorded_whole_file(incident_file, '# Mar 2023-Apr 2023')
+
+
+def test_append_after_a_new_header_records_that_header(tmp_path):
+    incident_file = IncidentFile(tmp_path, FIRST_PART)
+    incident_file.ingest()
+    incident_file.write("\n# Apr 2023-Jun 2023\n" + APPENDED_PART, mode='a')
+
+    plan, upload_df = incident_file.ingest()
+
+    assert plan.start == len(FIRST_PART.encode())
+    assert len(upload_df) == 2
+    assert_recorded_whole_file(incident_file, '# Apr 2023-Jun 2023')
+
+
+def test_edited_file_is_parsed_again_in_full(tmp_path):
+    incident_file = IncidentFile(tmp_path, FIRST_PART)
+    incident_file.ingest()
+    # same size, different content
+    incident_file.write(FIRST_PART.replace('Nov 3', 'Nov 4'))
+
+    plan, upload_df = incident_file.ingest()
+
+    assert (plan.start, plan.period_header) == (0, None)
+    pd.testing.assert_frame_equal(upload_df, full_parse(incident_file.path))
+    assert_recorded_whole_file(incident_file, '# Mar 2023-Apr 2023')
+
+
+def test_truncated_file_is_parsed_again_in_full(tmp_path):
+    incident_file = IncidentFile(tmp_path, FIRST_PART + APPENDED_PART)
+    incident_file.ingest()
+    incident_file.write(FIRST_PART)
+
+    plan, upload_df = incident_file.ingest()
+
+    assert (plan.start, plan.period_header) == (0, None)
+    pd.testing.assert_frame_equal(upload_df, full_parse(incident_file.path))
+    assert_recorded_whole_file(incident_file, '# Mar 2023-Apr 2023')
+
+
+def test_missing_final_newline_is_parsed_again_in_full(tmp_path):
+    # the last line may have still been being written, so what is appended could be the rest of it
+    incident_file = IncidentFile(tmp_path, FIRST_PART + "- Late to")
+    incident_file.ingest()
+    incident_file.write(" drop-off again.\n", mode='a')
+
+    plan, upload_df = incident_file.ingest()
+
+    assert (plan.start, plan.period_header) == (0, None)
+    assert upload_df.description.iloc[-1] == 'Late to drop-off again'
+    pd.testing.assert_frame_equal(upload_df, full_parse(incident_file.path))
+    assert_recorded_whole_file(incident_file, '# Mar 2023-Apr 2023')
@@ -0,0 +1,61 @@
+import datetime
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('streamlit')
+
+from streamlit_app.utilities import build_time_series, get_bubble_labels, set_column_types  # noqa: E402
+
+
+def get_category_counts_df() -> pd.DataFrame:
+    # as get_category_counts returns it: one row per category, then one per category and subcategory
+    return set_column_types(pd.DataFrame({
+        'category': ['Conduct', 'Parenting', 'Conduct', 'Parenting', 'Parenting'],
+        'subcategory': [None, None, 'Police/CPS involvement', 'Missed pickup', 'Late to drop-off'],
+        'is_category_total': [True, True, False, False, False],
+        'n': [3, 5, 3, 4, 1],
+    }))
+
+
+def test_category_counts_are_categorical():
+    counts_df = get_category_counts_df()
+
+    assert isinstance(counts_df.category.dtype, pd.CategoricalDtype)
+    assert isinstance(counts_df.subcategory.dtype, pd.CategoricalDtype)
+
+
+def test_bubble_labels_for_categories():
+    counts_df = get_category_counts_df()
+
+    labels = get_bubble_labels(counts_df[counts_df.is_category_total], 'category')
+
+    assert list(labels) == ['Conduct<br>3', 'Parenting<br>5']
+
+
+def test_bubble_labels_for_subcategories():
+    counts_df = get_category_counts_df()
+    agg_df = counts_df[~counts_df.is_category_total & counts_df.subcategory.notnull()].reset_index(drop=True)
+
+    labels = get_bubble_labels(agg_df, 'subcategory')
+
+    assert list(labels) == ['Police/CPS involvement<br>3', 'Missed pickup<br>4', 'Late to drop-off<br>1']
+
+
+def test_time_series_on_categorical_labels():
+    # as get_daily_counts returns it
+    daily_df = set_column_types(pd.DataFrame({
+        'date': ['2024-01-01', '2024-01-01', '2024-01-03'],
+        'category': ['Conduct', 'Parenting', None],
+        'custom_label': ['school', None, 'school'],
+        'severity': ['HIGH', 'LOW', 'HIGH'],
+        'n': [2, 1, 4],
+    }))
+
+    series_df = build_time_series(daily_df, ['custom_label'], rolling_window=2,
+                                  start_date=datetime.date(2024, 1, 1), end_date=datetime.date(2024, 1, 3))
+
+    school = series_df[series_df.custom_label == 'school']
+    assert list(school.n) == [2, 0, 4]
+    assert list(series_df[series_df.custom_label.isna()].n) == [1, 0, 0]
+    assert series_df.n.sum() == daily_df.n.sum()
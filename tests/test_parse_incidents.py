@@ -0,0 +1,55 @@
+import re
+
+import pandas as pd
+
+from data_processing.utilities import extract_possible_incident_dates, strip_descriptions
+
+INCIDENTS = [
+    "[Oct 22] Missed pickup by 20 minutes.",
+    "[october] Did not share the school calendar.",
+    "January 28. Cancelled the weekend visit, no reason given.",
+    "august. Late to drop-off again",
+    "No date on this one, argued in front of child.",
+    "\t[Feb 3].  Forgot the medication, again [].",
+    "  [Mar 4] Said Mar 4 was fine, then changed it.",
+    "[] Nothing in the brackets.",
+    "Dec 1 2020. Three words isn't a date",
+    "",
+]
+
+
+def extract_possible_incident_date(s: str) -> str:
+    # the original scalar version, one incident at a time, as the reference for the columnar one
+    for pattern, group in [(r"^\s*\[(.*?)\]", 1), (r"^\s*(\w+(\s+\w+)?)\.", 0)]:
+        match = re.search(pattern, s)
+        if match:
+            return match.group(group).strip('.').strip(' ')
+
+    return None
+
+
+def test_extract_possible_incident_dates_matches_scalar():
+    full_incident = pd.Series(INCIDENTS, index=range(10, 10 + len(INCIDENTS)))
+
+    parsed_date = extract_possible_incident_dates(full_incident)
+
+    assert parsed_date.index.equals(full_incident.index)
+    assert list(parsed_date) == [extract_possible_incident_date(s) for s in INCIDENTS]
+
+
+def test_strip_descriptions_matches_scalar():
+    full_incident = pd.Series(INCIDENTS)
+    parsed_date = extract_possible_incident_dates(full_incident)
+
+    description = strip_descriptions(full_incident, parsed_date)
+
+    assert list(description) == [s.replace(extract_possible_incident_date(s) or '', '').replace('[]', '')
+                                 .strip(' ').strip('.') for s in INCIDENTS]
+
+
+def test_no_dates():
+    full_incident = pd.Series(["No date here", "Nor here"])
+    parsed_date = extract_possible_incident_dates(full_incident)
+
+    assert list(parsed_date) == [None, None]
+    assert list(strip_descriptions(full_incident, parsed_date)) == ["No date here", "Nor here"]
@@ -0,0 +1,52 @@
+import pandas as pd
+import pytest
+
+from benchmarks.incident_corpus import generate_corpus
+from data_processing.read_mkdown_file import ShardReader, iter_raw_batches, read_data_into_raw_df, \
+    transform_data_for_upload, transform_shards
+
+
+@pytest.fixture(scope='module')
+def corpus_file(tmp_path_factory) -> str:
+    filename = str(tmp_path_factory.mktemp('corpus') / 'corpus.txt')
+    generate_corpus(filename, 20_000)
+    return filename
+
+
+def parse_in_one_go(filename: str) -> pd.DataFrame:
+    return transform_data_for_upload(read_data_into_raw_df(filename), infer_dates=True).reset_index(drop=True)
+
+
+def parse_streamed(filename: str, batch_size: int) -> pd.DataFrame:
+    return pd.concat([transform_data_for_upload(incident_df, infer_dates=True)
+                      for incident_df in iter_raw_batches(filename, batch_size)], ignore_index=True)
+
+
+def test_streamed_batches_match_reading_in_one_go(corpus_file):
+    pd.testing.assert_frame_equal(parse_streamed(corpus_file, 777), parse_in_one_go(corpus_file))
+
+
+def test_batch_cut_right_before_a_header(tmp_path):
+    filename = str(tmp_path / 'incidents.txt')
+    with open(filename, 'w') as file:
+        file.write("# Nov 2022-Feb 2023\n- [Nov 3] Missed pickup.\n- january. Cancelled the visit.\n"
+                   "# Mar 2023-Apr 2023\n- Forgot the medication.\n- [april] Late again.\n")
+
+    batches = list(iter_raw_batches(filename, 2))
+
+    # the first batch fills up just before the second header, so the next one starts with the old header, then the new
+    assert list(batches[1].full_incident[:2]) == ['# Nov 2022-Feb 2023', '# Mar 2023-Apr 2023']
+    pd.testing.assert_frame_equal(parse_streamed(filename, 2), parse_in_one_go(filename))
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_sharded_output_does_not_depend_on_the_worker_count(corpus_file, workers):
+    # small shards, so there are many more of them than workers
+    shards = list(ShardReader(corpus_file, 32 * 1024))
+    assert len(shards) > 2 * workers
+    # shards are only ever cut right before a header
+    assert all(shard.data.startswith(b'#') for shard in shards)
+
+    upload_df = pd.concat(transform_shards(shards, True, workers), ignore_index=True)
+
+    pd.testing.assert_frame_equal(upload_df, parse_in_one_go(corpus_file))
@@ -0,0 +1,55 @@
+import os
+
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+
+from data_processing.utilities import create_tmp_incident_table, load_tmp_incident, merge_tmp_incident
+
+# a migrated postgres database; everything written to it is rolled back
+TEST_DB_URL = os.environ.get("THRIVE_TEST_DB_URL")
+
+# far from any real user, in case the database isn't empty
+TEST_USER_ID = 2_000_000_001
+
+
+@pytest.fixture
+def txn():
+    if not TEST_DB_URL:
+        pytest.skip("THRIVE_TEST_DB_URL is not set")
+
+    engine = create_engine(TEST_DB_URL)
+    with engine.connect() as conn:
+        transaction = conn.begin()
+        try:
+            yield conn
+        finally:
+            transaction.rollback()
+    engine.dispose()
+
+
+def upload(txn, upload_df: pd.DataFrame):
+    create_tmp_incident_table(txn)
+    load_tmp_incident(txn, upload_df)
+    return merge_tmp_incident(txn)
+
+
+def test_reuploading_the_same_incidents_rewrites_nothing(txn):
+    upload_df = pd.DataFrame({
+        'user_id': TEST_USER_ID,
+        'incident_at': pd.to_datetime(['2023-01-05 10:30:00.123456', '2023-01-06', None]),
+        'description': ['Missed pickup', 'Late to drop-off', 'No date'],
+        'description_hash': ['hash-1', 'hash-2', 'hash-3'],
+    })
+
+    first = upload(txn, upload_df)
+    second = upload(txn, upload_df)
+
+    assert (first.rows_inserted, first.rows_updated) == (3, 0)
+    assert (second.rows_staged, second.rows_inserted, second.rows_updated, second.rows_unchanged) == (3, 0, 0, 3)
+
+    moved_df = upload_df.assign(incident_at=upload_df.incident_at.where(upload_df.description_hash != 'hash-2',
+                                                                        pd.Timestamp('2023-01-07')))
+    third = upload(txn, moved_df)
+
+    assert (third.rows_inserted, third.rows_updated, third.rows_unchanged) == (0, 1, 2)
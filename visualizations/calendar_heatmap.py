@@ -1,16 +1,16 @@
 import pandas as pd
 from plotly_calplot import calplot
 
-from db_utils import get_engine
+from db_utils import get_engine, fetch_dataframe
 
 engine = get_engine()
 
-df = pd.read_sql("""
+df = fetch_dataframe(engine, """
     SELECT incident_id, incident_at FROM incident.incident
     WHERE TRUE
         and user_id = 1 
         and incident_at is not null
-""", engine)
+""")
 
 df['date'] = df['incident_at'].dt.date
 agg_df = df.groupby('date', as_index=False).count()[['date', 'incident_at']].rename(columns={'incident_at': 'n'})
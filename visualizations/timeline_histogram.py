@@ -1,16 +1,15 @@
-import pandas as pd
 from lets_plot import *
 
-from db_utils import get_engine
+from db_utils import get_engine, fetch_dataframe
 
 engine = get_engine()
 
-df = pd.read_sql("""
+df = fetch_dataframe(engine, """
     SELECT incident_id, incident_at FROM incident.incident
     WHERE TRUE
         and user_id = 1 
         and incident_at is not null
-""", engine)
+""")
 
 g = ggplot(df, aes(x='incident_at')) + geom_histogram(fill='darkgreen') + theme_light() + \
     labs(x="Date", y="Frequency of Incidents", title="Timeline of Incidents")